@@ -0,0 +1,290 @@
+r"""
+An asyncio front-end to GAP
+
+Some GAP calls run for a long time, or forever (e.g. equality
+testing in some finitely presented groups; see
+``Groups.GAP.ParentMethods.__truediv__``), and block the calling
+interpreter. ``amygap`` runs the calls in a separate GAP worker
+process; each call is awaitable, may be given a deadline, and can be
+cancelled. Upon timeout or cancellation, the worker is killed and a
+fresh one is started for the subsequent calls.
+
+Objects are shipped to the worker as GAP serialized strings; see
+:mod:`mygap_pool`.
+
+EXAMPLES::
+
+    sage: import asyncio
+    sage: from mygap import mygap
+    sage: from amygap import amygap
+    sage: G = mygap.SymmetricGroup(5)
+
+GAP functions are accessed as attributes::
+
+    sage: asyncio.run(amygap.Size(G))
+    120
+    sage: asyncio.run(amygap.Centre(G))
+    Group(())
+
+Methods of semantic handles are called with :meth:`AsyncMyGap.call`::
+
+    sage: asyncio.run(amygap.call(G, "is_abelian"))
+    False
+
+A deadline can be specified; upon expiration, the computation is
+interrupted and :class:`asyncio.TimeoutError` is raised::
+
+    sage: try:
+    ....:     asyncio.run(amygap.eval("First([1 .. 10^18], x -> false)", timeout=1))
+    ....: except asyncio.TimeoutError:
+    ....:     print("timeout")
+    timeout
+
+This is typically useful for computations that may not terminate,
+like the order of a finitely presented group::
+
+    sage: F = mygap.FreeGroup("a", "b")
+    sage: a, b = F.group_generators()
+    sage: G = F / [ a * b * a^-1 * b^-2 ]
+    sage: asyncio.run(amygap.Size(G, timeout=2))         # not tested
+    Traceback (most recent call last):
+    ...
+    TimeoutError
+
+The worker has been restarted and is ready for further calls::
+
+    sage: asyncio.run(amygap.eval("2^10"))
+    1024
+
+Several calls can be awaited concurrently; they are run one at a
+time by the worker, while the event loop keeps serving other tasks::
+
+    sage: async def sizes():
+    ....:     return await asyncio.gather(*(amygap.Size(mygap.SymmetricGroup(n))
+    ....:                                   for n in range(1, 5)))
+    sage: asyncio.run(sizes())
+    [1, 2, 6, 24]
+
+.. TODO::
+
+    - Use a pool of workers to run several calls in parallel.
+"""
+import asyncio
+import multiprocessing
+
+from sage.libs.gap.libgap import libgap
+from mygap_pool import to_transport, from_transport, convert
+
+##############################################################################
+# Worker side
+
+class UnpicklableResultError(Exception):
+    """
+    Raised when the result of a successful call can't be sent back from the GAP worker.
+    """
+
+def _serve(connection, packages):
+    """
+    Serve requests received through ``connection`` until it is closed.
+
+    A request is a tuple ``(kind, name, obj, args)`` where ``kind`` is
+    one of ``"eval"``, ``"function"`` or ``"method"``. The reply is a
+    pair ``(True, result)`` or ``(False, exception)``; when the result
+    can't be pickled, the exception is an
+    :class:`UnpicklableResultError`.
+    """
+    import mygap
+    for package in packages:
+        libgap.LoadPackage(package)
+    while True:
+        try:
+            kind, name, obj, args = connection.recv()
+        except EOFError:
+            return
+        try:
+            args = [from_transport(arg) for arg in args]
+            if kind == "eval":
+                result = mygap.mygap.eval(name)
+            elif kind == "function":
+                result = getattr(mygap.mygap, name)(*args)
+            else:
+                result = getattr(from_transport(obj), name)(*args)
+            try:
+                result = convert(result)
+            except NotImplementedError:
+                pass
+            reply = (True, to_transport(result))
+        except Exception as exception:
+            reply = (False, exception)
+        try:
+            connection.send(reply)
+        except Exception as exception:
+            if reply[0]:
+                error = UnpicklableResultError("the result of {} can't be pickled: {}".format(name, exception))
+            else: # the exception itself can't be pickled
+                error = RuntimeError(repr(reply[1]))
+            connection.send((False, error))
+
+class Worker(object):
+    """
+    A GAP worker process, serving one request at a time.
+
+    INPUT:
+
+    - ``packages`` -- a list of GAP packages to load in the worker
+
+    The process is started on the first request.
+    """
+    def __init__(self, packages=()):
+        self._packages = tuple(packages)
+        self._process = None
+        self._connection = None
+        self._lock = None
+        self._lock_loop = None
+
+    def start(self):
+        """
+        Start the worker process.
+        """
+        connection, child_connection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve,
+                                                args=(child_connection, self._packages),
+                                                daemon=True)
+        self._process.start()
+        child_connection.close()
+        self._connection = connection
+
+    def stop(self):
+        """
+        Kill the worker process, interrupting any running computation.
+        """
+        if self._process is None:
+            return
+        self._connection.close()
+        self._process.kill()
+        self._process.join()
+        self._process = None
+        self._connection = None
+
+    def restart(self):
+        """
+        Kill the worker process, and start a fresh one.
+        """
+        self.stop()
+        self.start()
+
+    async def _receive(self):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self._connection.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            await ready
+        finally:
+            loop.remove_reader(fd)
+        return self._connection.recv()
+
+    async def request(self, kind, name, obj=None, args=(), timeout=None):
+        """
+        Run a request in the worker and return its result.
+
+        INPUT:
+
+        - ``kind``, ``name``, ``obj``, ``args`` -- see :func:`_serve`
+        - ``timeout`` -- a number of seconds, or ``None``
+
+        Upon timeout or cancellation, the worker is restarted.
+        """
+        loop = asyncio.get_running_loop()
+        if self._lock_loop is not loop: # asyncio locks are bound to an event loop
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        async with self._lock:
+            if self._process is None:
+                self.start()
+            self._connection.send((kind, name,
+                                   None if obj is None else to_transport(obj),
+                                   tuple(to_transport(arg) for arg in args)))
+            try:
+                success, result = await asyncio.wait_for(self._receive(), timeout)
+            except BaseException: # including asyncio.CancelledError
+                self.restart()
+                raise
+        if not success:
+            raise result
+        return from_transport(result)
+
+##############################################################################
+
+class AsyncMyGap(object):
+    """
+    An asyncio interface to a GAP worker process.
+
+    INPUT:
+
+    - ``packages`` -- a list of GAP packages to load in the worker
+
+    Results which are GAP objects are converted to Sage if possible,
+    and otherwise returned as semantic handles. See the module
+    documentation for examples.
+    """
+    def __init__(self, packages=()):
+        self._worker = Worker(packages)
+
+    class Function:
+        def __init__(self, worker, name):
+            self._worker = worker
+            self._name = name
+
+        def __call__(self, *args, **options):
+            return self._worker.request("function", self._name, args=args,
+                                        timeout=options.get("timeout"))
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.Function(self._worker, name)
+
+    def eval(self, code, timeout=None):
+        """
+        Return (asynchronously) the result of evaluating ``code`` in the GAP worker.
+
+        EXAMPLES::
+
+            sage: import asyncio
+            sage: from amygap import amygap
+            sage: asyncio.run(amygap.eval("Size(SymmetricGroup(4))"))
+            24
+        """
+        return self._worker.request("eval", code, timeout=timeout)
+
+    def call(self, obj, method_name, *args, **options):
+        """
+        Return (asynchronously) the result of ``obj.method_name(*args)``, run in the GAP worker.
+
+        INPUT:
+
+        - ``obj`` -- a semantic handle
+        - ``method_name`` -- the name of a method of ``obj``
+        - ``args`` -- further arguments for the method
+        - ``timeout`` -- a number of seconds, or ``None`` (default)
+
+        EXAMPLES::
+
+            sage: import asyncio
+            sage: from mygap import mygap
+            sage: from amygap import amygap
+            sage: H = mygap.FullTransformationMonoid(3)
+            sage: asyncio.run(amygap.call(H, "cardinality", timeout=10))
+            27
+        """
+        return self._worker.request("method", method_name, obj, args,
+                                    timeout=options.get("timeout"))
+
+    def restart(self):
+        """
+        Kill the GAP worker and start a fresh one.
+        """
+        self._worker.restart()
+
+amygap = AsyncMyGap()
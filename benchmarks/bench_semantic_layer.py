@@ -0,0 +1,247 @@
+r"""
+Benchmarks of the semantic layer against plain libgap
+
+Each benchmark class times an operation through the semantic handles
+(``time_mygap_*``) and the same operation done directly with libgap
+(``time_libgap_*``). The ``track_overhead_*`` benchmarks report the
+ratio between the two, so that regressions of the interface are
+caught independently of the speed of GAP itself.
+
+Run with ``make bench`` (see ``asv.conf.json``).
+"""
+import timeit
+
+import sage.all
+from sage.libs.gap.libgap import libgap
+
+import mygap
+from mygap import mygap as gap
+
+def overhead(semantic, plain, number=100, repeat=5):
+    """
+    Return the ratio of the running times of ``semantic()`` and ``plain()``.
+
+    Both are timed ``number`` times in a row; the best of ``repeat``
+    measurements is taken.
+    """
+    semantic_time = min(timeit.repeat(semantic, number=number, repeat=repeat))
+    plain_time = min(timeit.repeat(plain, number=number, repeat=repeat))
+    return semantic_time / plain_time
+
+def _time_mygap(self):
+    self.mygap()
+
+def _time_libgap(self):
+    self.libgap()
+
+def _track_overhead(self):
+    return overhead(self.mygap, self.libgap, number=self.number)
+_track_overhead.unit = "ratio"
+
+class Overhead(object):
+    """
+    Mixin for the benchmark classes, providing ``time_mygap``,
+    ``time_libgap`` and ``track_overhead``.
+
+    Subclasses define ``mygap`` and ``libgap`` methods performing the
+    same operation. The benchmarks are only installed in the
+    subclasses, so that asv does not collect this mixin itself.
+    """
+    number = 100
+
+    def __init_subclass__(cls, **kwds):
+        super().__init_subclass__(**kwds)
+        cls.time_mygap = _time_mygap
+        cls.time_libgap = _time_libgap
+        cls.track_overhead = _track_overhead
+
+##############################################################################
+# Handle creation
+
+class HandleCreation(Overhead):
+    """
+    Creating a semantic handle: ``mygap.SymmetricGroup(5)``
+    """
+    def mygap(self):
+        gap.SymmetricGroup(5)
+
+    def libgap(self):
+        libgap.SymmetricGroup(5)
+
+class RetrieveStructure(Overhead):
+    """
+    Computing the class and category of a semantic handle
+    """
+    def setup(self):
+        self.handle = libgap.SymmetricGroup(5)
+
+    def mygap(self):
+        mygap.retrieve_structure_of_gap_handle(self.handle)
+
+    def libgap(self):
+        self.handle.CategoriesOfObject()
+
+##############################################################################
+# Dispatch through the generated wrappers
+
+class WrapperDispatch(Overhead):
+    """
+    Calling a generated wrapper method: ``G.cardinality()``
+    """
+    def setup(self):
+        self.G = gap.SymmetricGroup(5)
+        self.handle = self.G.gap()
+
+    def mygap(self):
+        self.G.cardinality()
+
+    def libgap(self):
+        self.handle.Size().sage()
+
+##############################################################################
+# Arithmetic
+
+class GroupMultiplication(Overhead):
+    """
+    ``_mul_`` on permutations
+    """
+    number = 1000
+
+    def setup(self):
+        G = gap.SymmetricGroup(8)
+        self.s, self.t = G.group_generators()
+        self.hs, self.ht = self.s.gap(), self.t.gap()
+
+    def mygap(self):
+        self.s * self.t
+
+    def libgap(self):
+        self.hs * self.ht
+
+class MonoidMultiplication(Overhead):
+    """
+    ``_mul_`` on words in a free monoid
+    """
+    number = 1000
+
+    def setup(self):
+        M = gap.FreeMonoid(2)
+        self.m1, self.m2 = M.monoid_generators()
+        self.h1, self.h2 = self.m1.gap(), self.m2.gap()
+
+    def mygap(self):
+        self.m1 * self.m2
+
+    def libgap(self):
+        self.h1 * self.h2
+
+class FieldAddition(Overhead):
+    """
+    ``_add_`` in a finite field
+    """
+    number = 1000
+
+    def setup(self):
+        F = gap.FiniteField(7)
+        self.x = F.an_element()
+        self.y = F.one()
+        self.hx, self.hy = self.x.gap(), self.y.gap()
+
+    def mygap(self):
+        self.x + self.y
+
+    def libgap(self):
+        self.hx + self.hy
+
+class FieldMultiplication(FieldAddition):
+    """
+    ``_mul_`` in a finite field
+    """
+    def mygap(self):
+        self.x * self.y
+
+    def libgap(self):
+        self.hx * self.hy
+
+##############################################################################
+# Iteration
+
+class Iteration(Overhead):
+    """
+    Iterating through a finite parent
+    """
+    number = 10
+
+    def setup(self):
+        self.G = gap.SymmetricGroup(5)
+        self.handle = self.G.gap()
+
+    def mygap(self):
+        list(self.G)
+
+    def libgap(self):
+        iterator = self.handle.Iterator()
+        while not iterator.IsDoneIterator():
+            iterator.NextIterator()
+
+class List(Overhead):
+    """
+    Listing the elements of a finite parent
+    """
+    number = 10
+
+    def setup(self):
+        self.G = gap.SymmetricGroup(5)
+        self.handle = self.G.gap()
+
+    def mygap(self):
+        self.G.list()
+
+    def libgap(self):
+        list(self.handle.AsList())
+
+##############################################################################
+# Structure queries
+
+class GreensJClasses(Overhead):
+    """
+    ``j_classes()`` of a full transformation monoid
+    """
+    number = 10
+
+    def mygap(self):
+        # A fresh copy, to avoid GAP's attribute caching
+        gap.FullTransformationMonoid(4).j_classes()
+
+    def libgap(self):
+        libgap.FullTransformationMonoid(4).GreensJClasses()
+
+class GreensRClasses(Overhead):
+    """
+    ``r_classes()`` of a full transformation monoid
+    """
+    number = 10
+
+    def mygap(self):
+        gap.FullTransformationMonoid(4).r_classes()
+
+    def libgap(self):
+        libgap.FullTransformationMonoid(4).GreensRClasses()
+
+class CayleyGraph(Overhead):
+    """
+    ``cayley_graph()`` of a transformation monoid
+
+    The baseline is GAP's computation of the right Cayley graph.
+    """
+    number = 1
+
+    def setup(self):
+        self.T = gap.FullTransformationMonoid(3)
+        self.handle = self.T.gap()
+
+    def mygap(self):
+        self.T.cayley_graph()
+
+    def libgap(self):
+        libgap.RightCayleyGraphSemigroup(self.handle)
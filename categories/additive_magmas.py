@@ -24,7 +24,8 @@ class AdditiveMagmas:
                     sage: a + a
                     2
                 """
-                return self.parent(self.gap() + other.gap()) # TODO; call directly the gap operation
+                from mygap import gap_operation
+                return gap_operation(self.parent(), r"\+", self, other)
 
     class AdditiveUnital(CategoryWithAxiom):
 
@@ -76,4 +77,5 @@ class AdditiveMagmas:
                             sage: a - a
                             ZmodnZObj( 0, 4 )
                         """
-                        return self.parent()(self.gap().AdditiveInverse())
+                        from mygap import gap_operation
+                        return gap_operation(self.parent(), "AdditiveInverse", self)
@@ -1,6 +1,176 @@
+from collections import namedtuple
 from sage.categories.category_with_axiom import CategoryWithAxiom, all_axioms
 
 class FiniteGroups:
     class GAP(CategoryWithAxiom):
         class ParentMethods:
-            pass
+
+            def conjugacy_classes_chunks(self, chunk_size=1000):
+                r"""
+                Iterate over the conjugacy classes of this group, by chunks.
+
+                INPUT:
+
+                - ``chunk_size`` -- a positive integer (default: 1000);
+                  the number of classes per chunk
+
+                OUTPUT:
+
+                An iterator over :class:`ConjugacyClassesChunk` named
+                tuples, with fields:
+
+                - ``start`` -- the index of the first class of the chunk
+                - ``representatives`` -- a :class:`mygap.GAPList` of the
+                  representatives of the classes, wrapped as elements of
+                  ``self`` on access only
+                - ``sizes`` -- the array of the sizes of the classes
+                - ``orders`` -- the array of the orders of their elements
+                - ``centralizer_orders`` -- the array of the orders of
+                  the centralizers of their representatives
+
+                The classes are computed once by GAP, and stored there
+                as the attribute ``ConjugacyClasses``; each chunk then
+                costs a single GAP call, and no class object is wrapped.
+                The arrays have dtype ``int64``, or ``object`` when the
+                order of the group does not fit in 64 bits.
+
+                The classes are indexed in the order of GAP; this is the
+                numbering used by :meth:`class_labels`.
+
+                EXAMPLES::
+
+                    sage: from mygap import mygap
+                    sage: G = mygap.SymmetricGroup(5)
+                    sage: chunks = list(G.conjugacy_classes_chunks(chunk_size=3))
+                    sage: [chunk.start for chunk in chunks]
+                    [0, 3, 6]
+                    sage: chunk = chunks[0]
+                    sage: chunk.sizes, chunk.orders                      # random
+                    (array([ 1, 10, 15]), array([1, 2, 2]))
+                    sage: (chunk.sizes * chunk.centralizer_orders == 120).all()
+                    True
+                    sage: chunk.representatives[1].parent() is G
+                    True
+                    sage: sum(chunk.sizes.sum() for chunk in chunks)
+                    120
+                """
+                import numpy
+                from mygap import GAPList, gap_call, compiled_function
+                from mygap_numpy import integers_from_string
+                if chunk_size < 1:
+                    raise ValueError("the chunk size should be positive")
+                dtype = numpy.int64 if self.cardinality() < 2**63 else object
+                n = gap_call(compiled_function("G -> Length(ConjugacyClasses(G))"), self.gap()).sage()
+                for start in range(0, n, chunk_size):
+                    stop = min(start + chunk_size, n)
+                    representatives, sizes, orders, centralizer_orders = \
+                        gap_call(compiled_function(_conjugacy_classes_chunk), self.gap(), start + 1, stop)
+                    yield ConjugacyClassesChunk(start,
+                                                GAPList(representatives, universe=self),
+                                                integers_from_string(sizes, dtype),
+                                                integers_from_string(orders, dtype),
+                                                integers_from_string(centralizer_orders, dtype))
+
+            def class_labels(self, elements):
+                r"""
+                Return the indices of the conjugacy classes of ``elements``.
+
+                INPUT:
+
+                - ``elements`` -- a list of elements of ``self``, or a
+                  GAP list of elements (e.g. a :class:`mygap.GAPList`)
+
+                OUTPUT: a NumPy ``int64`` array
+
+                The classes are indexed as in :meth:`conjugacy_classes_chunks`.
+                All the elements are labelled by a single GAP call: the
+                classes are first sorted by an invariant (the order and,
+                for permutation groups, the cycle type), so that
+                conjugacy is only tested between elements and classes
+                with the same invariant, and not at all when this
+                invariant determines the class.
+
+                EXAMPLES::
+
+                    sage: import numpy
+                    sage: from mygap import mygap
+                    sage: G = mygap.SymmetricGroup(5)
+                    sage: chunk, = G.conjugacy_classes_chunks()
+                    sage: G.class_labels(chunk.representatives)
+                    array([0, 1, 2, 3, 4, 5, 6])
+                    sage: labels = G.class_labels(G.list())
+                    sage: (numpy.bincount(labels) == chunk.sizes).all()
+                    True
+
+                Elements outside of the group are reported::
+
+                    sage: A = mygap.AlternatingGroup(5)
+                    sage: A.class_labels([G(libgap.eval("(1,2)"))])
+                    Traceback (most recent call last):
+                    ...
+                    GAPError: Error, the element (1,2) is not in the group
+                """
+                from mygap import gap_call, compiled_function, gap_handle
+                from mygap_numpy import integers_from_string
+                labels = gap_call(compiled_function(_class_labels), self.gap(), gap_handle(elements))
+                return integers_from_string(labels)
+
+
+# The representatives, sizes, element orders and centralizer orders of
+# the conjugacy classes start .. stop
+_conjugacy_classes_chunk = """function(G, start, stop)
+    local classes, join;
+    classes := ConjugacyClasses(G){[start .. stop]};
+    join := l -> JoinStringsWithSeparator(List(l, String), ",");
+    return [List(classes, Representative),
+            join(List(classes, Size)),
+            join(List(classes, C -> Order(Representative(C)))),
+            join(List(classes, C -> Size(Centralizer(C))))];
+end"""
+
+# The indices of the conjugacy classes of the elements; the classes
+# are looked up by invariant, and conjugacy is only tested between
+# classes sharing an invariant
+_class_labels = """function(G, elements)
+    local classes, invariant, table, labels, candidates, key, x, i;
+    classes := ConjugacyClasses(G);
+    if IsPermGroup(G) then
+        invariant := x -> String([Order(x), CycleStructurePerm(x)]);
+    else
+        invariant := x -> String(Order(x));
+    fi;
+    table := NewDictionary("", true);
+    for i in [1 .. Length(classes)] do
+        key := invariant(Representative(classes[i]));
+        candidates := LookupDictionary(table, key);
+        if candidates = fail then
+            AddDictionary(table, key, [i]);
+        else
+            Add(candidates, i);
+        fi;
+    od;
+    labels := [];
+    for x in elements do
+        candidates := LookupDictionary(table, invariant(x));
+        if candidates = fail then
+            Error("the element ", x, " is not in the group");
+        fi;
+        if Length(candidates) = 1 then
+            # The invariant determines the class, provided x is in G
+            i := candidates[1];
+            if not x in G then
+                Error("the element ", x, " is not in the group");
+            fi;
+        else
+            i := First(candidates, i -> x in classes[i]);
+            if i = fail then
+                Error("the element ", x, " is not in the group");
+            fi;
+        fi;
+        Add(labels, i - 1);
+    od;
+    return JoinStringsWithSeparator(List(labels, String), ",");
+end"""
+
+ConjugacyClassesChunk = namedtuple("ConjugacyClassesChunk",
+                                   ["start", "representatives", "sizes", "orders", "centralizer_orders"])
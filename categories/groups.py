@@ -1,3 +1,4 @@
+from collections import namedtuple
 from sage.categories.category_with_axiom import CategoryWithAxiom, all_axioms
 from sage.misc.cachefunc import cached_method
 from sage.libs.gap.libgap import libgap
@@ -23,7 +24,8 @@ class Groups:
                     sage: SL(2, 17).is_abelian()
                     False
                 """
-                return self.gap().IsAbelian().sage()
+                from mygap import call_gap_operation
+                return call_gap_operation("Groups.GAP.ParentMethods.is_abelian", "IsAbelian", (self,))
 
             @cached_method
             def group_generators(self):
@@ -41,7 +43,110 @@ class Groups:
                     sage: SL(2, 17).is_abelian()
                     False
                 """
-                return tuple(self(handle) for handle in self.gap().GeneratorsOfGroup())
+                from mygap import call_gap_operation
+                return call_gap_operation("Groups.GAP.ParentMethods.group_generators",
+                                          "GeneratorsOfGroup", (self,),
+                                          lambda handles: tuple(self(handle) for handle in handles))
+
+            def orbit_labels(self, seeds, action="OnPoints", schreier=False):
+                r"""
+                Classify the points, tuples or sets ``seeds`` into orbits under this group.
+
+                INPUT:
+
+                - ``seeds`` -- a NumPy integer array of 0-based points;
+                  1-dimensional for ``action="OnPoints"``, and of shape
+                  ``(k, m)`` for ``"OnTuples"`` and ``"OnSets"``, with
+                  one tuple or set per row
+                - ``action`` -- ``"OnPoints"`` (default), ``"OnTuples"``
+                  or ``"OnSets"``; the GAP action function
+                - ``schreier`` -- a boolean (default: ``False``); whether
+                  to also return the Schreier vectors of the orbits;
+                  only for ``action="OnPoints"``
+
+                OUTPUT:
+
+                An :class:`OrbitLabels` named tuple with fields:
+
+                - ``labels`` -- the array of length ``k`` of the indices
+                  of the orbits of the seeds; orbits are numbered in the
+                  order in which they are met among the seeds
+                - ``representatives`` -- the array of the representatives
+                  of the orbits, namely their first seeds
+                - ``sizes`` -- the array of the sizes of the orbits
+                - ``schreier`` -- ``None``, or a :class:`SchreierVectors`
+
+                The orbits are all computed by a single GAP call, which
+                returns the arrays as strings (see
+                :func:`mygap_numpy.integers_from_string`). A seed lying
+                in an orbit already met costs a dictionary lookup.
+
+                EXAMPLES::
+
+                    sage: import numpy
+                    sage: from mygap import mygap
+                    sage: G = mygap.Group(libgap.eval("[(1,2,3), (4,5)]"))
+                    sage: O = G.orbit_labels(numpy.array([0, 3, 1, 5, 4, 2]))
+                    sage: O.labels
+                    array([0, 1, 0, 2, 1, 0])
+                    sage: O.representatives, O.sizes
+                    (array([0, 3, 5]), array([3, 2, 1]))
+
+                Tuples and sets are given as the rows of an array::
+
+                    sage: O = G.orbit_labels(numpy.array([[0, 1], [1, 0], [2, 0]]), action="OnTuples")
+                    sage: O.labels, O.sizes
+                    (array([0, 1, 0]), array([3, 3]))
+                    sage: O.representatives
+                    array([[0, 1],
+                           [1, 0]])
+                    sage: G.orbit_labels(numpy.array([[0, 1], [1, 0]]), action="OnSets").labels
+                    array([0, 0])
+
+                The stabilizer orders follow from the orbit sizes::
+
+                    sage: int(G.cardinality()) // O.sizes
+                    array([2, 2])
+
+                The Schreier vectors give, for each point of the orbits,
+                a word in the generators mapping the representative of its
+                orbit to it::
+
+                    sage: O = G.orbit_labels(numpy.array([0, 3]), schreier=True)
+                    sage: S = O.schreier
+                    sage: S.points
+                    array([0, 1, 2, 3, 4])
+                    sage: S.word(2)
+                    [0, 0]
+                    sage: S.word(4), S.word(3)
+                    ([1], [])
+                """
+                import numpy
+                from mygap import gap_call, compiled_function
+                from mygap_numpy import integers_from_string, _integer_array, _to_gap
+                if action not in ("OnPoints", "OnTuples", "OnSets"):
+                    raise ValueError("unknown action: {}".format(action))
+                if schreier and action != "OnPoints":
+                    raise ValueError("Schreier vectors are only available for the action on points")
+                seeds = _integer_array(seeds, 1 if action == "OnPoints" else 2)
+                if action == "OnSets":
+                    seeds = numpy.sort(seeds, axis=1)
+                if not len(seeds):
+                    empty = numpy.zeros(seeds.shape, dtype=numpy.int64)
+                    return OrbitLabels(empty[:0].reshape(0), empty, empty[:0].reshape(0),
+                                       SchreierVectors(empty, empty, empty) if schreier else None)
+                if seeds.min() < 0:
+                    raise ValueError("the points should be non negative")
+                result = gap_call(compiled_function(_orbit_labels), self.gap(),
+                                  _to_gap(seeds + 1), libgap.eval(action), schreier)
+                labels, representatives, sizes = [integers_from_string(r) for r in result[:3]]
+                representatives = (representatives - 1).reshape((-1,) + seeds.shape[1:])
+                if schreier:
+                    points, generators, parents = [integers_from_string(r) for r in result[3:]]
+                    schreier = SchreierVectors(points - 1, generators, parents)
+                else:
+                    schreier = None
+                return OrbitLabels(labels, representatives, sizes, schreier)
 
             def __truediv__(self, relators):
                 r"""
@@ -89,5 +194,114 @@ class Groups:
                 limitation of GAP's implementation of the Knuth-Bendix procedure)::
 
                     sage: a * b * a^-1 * b^-2 == G.one() # not tested
+
+                When the quotient is finite, its elements can instead be
+                represented by their images under a faithful permutation
+                representation, computed once; see
+                :func:`native_elements.use_image_arrays`::
+
+                    sage: from native_elements import use_image_arrays
+                    sage: a, b = F.group_generators()
+                    sage: G = use_image_arrays(F / [a^2, b^3, (a*b)^5])
+                    sage: a, b = G.group_generators()
+                    sage: (a * b)^5 == G.one()
+                    True
                 """
                 return self._wrap( self.gap() / libgap([x.gap() for x in relators]) )
+
+
+# Orbits of the seeds, computed by breadth first search with a
+# dictionary mapping each point met to its position in the list of
+# all the orbit points
+_orbit_labels = """function(G, seeds, act, schreier)
+    local join, gens, dict, points, orbit, generators, parents, representatives, sizes, labels, x, i, j, k, y, start;
+    join := l -> JoinStringsWithSeparator(List(l, String), ",");
+    gens := GeneratorsOfGroup(G);
+    dict := NewDictionary(seeds[1], true);
+    points := [];
+    orbit := [];
+    generators := [];
+    parents := [];
+    representatives := [];
+    sizes := [];
+    labels := [];
+    for x in seeds do
+        i := LookupDictionary(dict, x);
+        if i = fail then
+            Add(representatives, x);
+            start := Length(points) + 1;
+            Add(points, x);
+            Add(orbit, Length(representatives) - 1);
+            Add(generators, -1);
+            Add(parents, -1);
+            AddDictionary(dict, x, start);
+            k := start;
+            while k <= Length(points) do
+                for j in [1 .. Length(gens)] do
+                    y := act(points[k], gens[j]);
+                    if LookupDictionary(dict, y) = fail then
+                        Add(points, y);
+                        Add(orbit, Length(representatives) - 1);
+                        Add(generators, j - 1);
+                        Add(parents, k - 1);
+                        AddDictionary(dict, y, Length(points));
+                    fi;
+                od;
+                k := k + 1;
+            od;
+            Add(sizes, Length(points) - start + 1);
+            i := start;
+        fi;
+        Add(labels, orbit[i]);
+    od;
+    if IsList(seeds[1]) then
+        representatives := Concatenation(representatives);
+    fi;
+    if schreier then
+        return [join(labels), join(representatives), join(sizes),
+                join(points), join(generators), join(parents)];
+    fi;
+    return [join(labels), join(representatives), join(sizes)];
+end"""
+
+OrbitLabels = namedtuple("OrbitLabels", ["labels", "representatives", "sizes", "schreier"])
+
+class SchreierVectors(namedtuple("SchreierVectors", ["points", "generators", "parents"])):
+    r"""
+    The Schreier vectors of some orbits of a group acting on points.
+
+    The orbits are concatenated in ``points``. For each index `i`,
+    ``points[i]`` is the image of ``points[parents[i]]`` by the
+    generator of index ``generators[i]``; both are `-1` for the
+    representatives of the orbits.
+    """
+    def position(self, point):
+        """
+        Return the index of ``point`` in ``points``.
+
+        A :class:`KeyError` is raised if it does not belong to the orbits.
+        """
+        import numpy
+        positions = self.__dict__.get("_positions")
+        if positions is None:
+            size = int(self.points.max()) + 1 if len(self.points) else 0
+            positions = self.__dict__["_positions"] = numpy.full(size, -1, dtype=numpy.int64)
+            positions[self.points] = numpy.arange(len(self.points))
+        if not 0 <= point < len(positions) or positions[point] == -1:
+            raise KeyError(point)
+        return int(positions[point])
+
+    def word(self, point):
+        """
+        Return a word in the generators mapping the representative of the orbit of ``point`` to it.
+
+        The word is a list of generator indices, to be applied from
+        left to right.
+        """
+        i = self.position(point)
+        word = []
+        while self.parents[i] != -1:
+            word.append(int(self.generators[i]))
+            i = self.parents[i]
+        word.reverse()
+        return word
@@ -41,6 +41,8 @@ Check membership::
       Later we might want to make things compatible with Travis Scrimshaw's
       bracket notation in his work on Lie algebras at :trac:`14901`.
 """
+from collections import namedtuple
+
 from sage.categories.category_types import Category_over_base_ring
 from sage.categories.category_with_axiom import CategoryWithAxiom
 from sage.categories.magmatic_algebras import MagmaticAlgebras
@@ -105,7 +107,187 @@ class LieAlgebras(Category_over_base_ring):
                 """
                 return tuple(self(handle) for handle in self.gap().GeneratorsOfAlgebra())
 
+            @cached_method
+            def structure_constants(self, sparse=False, dtype=float):
+                r"""
+                Return the structure constants of this finite dimensional Lie algebra in its GAP basis.
+
+                INPUT:
+
+                - ``sparse`` -- a boolean (default: ``False``)
+                - ``dtype`` -- the NumPy type of the coefficients
+                  (default: ``float``); use ``object`` to keep the exact
+                  Sage coefficients
+
+                OUTPUT:
+
+                If ``sparse`` is ``False``, the NumPy array ``T`` of shape
+                ``(n, n, n)`` such that `[b_i, b_j] = \sum_k T_{ijk} b_k`,
+                where `(b_1, \dots, b_n)` is ``Basis(L)`` in GAP. Otherwise,
+                the same tensor in coordinate format: a named tuple
+                ``(coords, values, shape)`` where ``coords`` is an integer
+                array of shape ``(nnz, 3)``.
+
+                The table is extracted by a single GAP call, and cached;
+                the returned arrays are thus read-only.
+
+                EXAMPLES::
+
+                    sage: from categories.lie_algebras import LieAlgebras
+                    sage: L = LieAlgebras(Rings()).GAP().example()
+                    sage: import numpy
+                    sage: T = L.structure_constants(); T.shape
+                    (3, 3, 3)
+                    sage: (T == -T.transpose(1, 0, 2)).all()
+                    True
+                    sage: S = L.structure_constants(sparse=True, dtype=object)
+                    sage: S.shape
+                    (3, 3, 3)
+                    sage: S.values[0].parent()
+                    Rational Field
+                    sage: D = numpy.zeros(S.shape); D[tuple(S.coords.T)] = S.values
+                    sage: (D == T).all()
+                    True
+                    sage: T[0, 0, 0] = 1
+                    Traceback (most recent call last):
+                    ...
+                    ValueError: assignment destination is read-only
+                """
+                import numpy
+                from mygap import gap_call, compiled_function
+                n, indices, values = gap_call(compiled_function(_structure_constants), self.gap())
+                n = n.sage()
+                coords = numpy.array(indices.sage(), dtype=numpy.int64).reshape(-1, 3)
+                values = numpy.array(values.sage(), dtype=dtype)
+                coords.flags.writeable = False
+                values.flags.writeable = False
+                if sparse:
+                    return SparseTensor(coords, values, (n, n, n))
+                tensor = numpy.zeros((n, n, n), dtype=dtype)
+                tensor[coords[:, 0], coords[:, 1], coords[:, 2]] = values
+                tensor.flags.writeable = False
+                return tensor
+
+            def from_vector(self, vector):
+                """
+                Return the element of this Lie algebra with coefficients ``vector`` in its GAP basis.
+
+                EXAMPLES::
+
+                    sage: from categories.lie_algebras import LieAlgebras
+                    sage: L = LieAlgebras(Rings()).GAP().example()
+                    sage: a, b = L.lie_algebra_generators()
+                    sage: L.from_vector((a * b).to_vector()) == a * b
+                    True
+                """
+                import numpy
+                from sage.libs.gap.libgap import libgap
+                from sage.rings.rational_field import QQ
+                coefficients = []
+                for c in list(vector):
+                    if isinstance(c, (float, numpy.floating)):
+                        c = QQ(float(c))
+                    elif isinstance(c, numpy.integer):
+                        c = int(c)
+                    coefficients.append(c)
+                return self(self.gap().Basis().LinearCombination(libgap(coefficients)))
+
+            def bracket_vectors(self, X, Y):
+                """
+                Return the coefficient vectors of the brackets of the coefficient vectors ``X`` and ``Y``.
+
+                INPUT:
+
+                - ``X``, ``Y`` -- NumPy arrays of shape ``(..., n)``,
+                  broadcast against each other
+
+                EXAMPLES::
+
+                    sage: import numpy
+                    sage: from categories.lie_algebras import LieAlgebras
+                    sage: L = LieAlgebras(Rings()).GAP().example()
+                    sage: a, b = L.lie_algebra_generators()
+                    sage: X = numpy.array([a.to_vector(), b.to_vector()])
+                    sage: numpy.allclose(L.bracket_vectors(X, X[::-1])[0], (a * b).to_vector())
+                    True
+                """
+                import numpy
+                return numpy.einsum("...i,...j,ijk->...k", X, Y, self.structure_constants())
+
+            def adjoint_matrices(self, X=None):
+                r"""
+                Return the matrices of the adjoint maps `\operatorname{ad}_x = [x, \cdot]` in the GAP basis.
+
+                INPUT:
+
+                - ``X`` -- a NumPy array of shape ``(..., n)`` of
+                  coefficient vectors, or ``None`` (default) for the basis
+
+                OUTPUT: an array of shape ``(..., n, n)``; the column `j`
+                of each matrix holds the coefficients of `[x, b_j]`. For
+                the basis, this is a read-only view of
+                :meth:`structure_constants`.
+                """
+                import numpy
+                T = self.structure_constants()
+                if X is None:
+                    return T.transpose(0, 2, 1)
+                return numpy.einsum("...i,ijk->...kj", X, T)
+
+            def killing_form_matrix(self):
+                r"""
+                Return the matrix of the Killing form `(x, y) \mapsto \operatorname{tr}(\operatorname{ad}_x \operatorname{ad}_y)` in the GAP basis.
+
+                EXAMPLES::
+
+                    sage: from categories.lie_algebras import LieAlgebras
+                    sage: L = LieAlgebras(Rings()).GAP().example()
+                    sage: import numpy
+                    sage: K = L.killing_form_matrix()
+                    sage: numpy.allclose(K, numpy.array(L.gap().Basis().KillingMatrix().sage(), dtype=float))
+                    True
+                """
+                import numpy
+                T = self.structure_constants()
+                return numpy.einsum("ilk,jkl->ij", T, T)
+
         class ElementMethods:
 
-            pass
+            def to_vector(self, dtype=float):
+                """
+                Return the NumPy vector of coefficients of this element in the GAP basis of its parent.
+
+                EXAMPLES::
+
+                    sage: from categories.lie_algebras import LieAlgebras
+                    sage: L = LieAlgebras(Rings()).GAP().example()
+                    sage: a, b = L.lie_algebra_generators()
+                    sage: (a * b).to_vector(dtype=object)       # random
+                    array([0, 0, 1], dtype=object)
+                """
+                import numpy
+                basis = self.parent().gap().Basis()
+                return numpy.array(basis.Coefficients(self.gap()).sage(), dtype=dtype)
+
+
+# The structure constants table of Basis(L), as coordinate lists
+_structure_constants = """function(L)
+    local B, T, n, indices, values, i, j, k;
+    B := Basis(L);
+    T := StructureConstantsTable(B);
+    n := Length(B);
+    indices := [];
+    values := [];
+    for i in [1 .. n] do
+        for j in [1 .. n] do
+            for k in [1 .. Length(T[i][j][1])] do
+                Append(indices, [i - 1, j - 1, T[i][j][1][k] - 1]);
+                Add(values, T[i][j][2][k]);
+            od;
+        od;
+    od;
+    return [n, indices, values];
+end"""
+
+SparseTensor = namedtuple("SparseTensor", ["coords", "values", "shape"])
 
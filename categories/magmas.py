@@ -18,7 +18,8 @@ class Magmas:
                     sage: f1 * f3 * f2
                     f1*f3*f2
                 """
-                return self.parent(self.gap() * other.gap()) # TODO; call directly the gap operation
+                from mygap import gap_operation
+                return gap_operation(self.parent(), r"\*", self, other)
 
     class Unital:
         class GAP(CategoryWithAxiom):
@@ -83,9 +84,11 @@ class Magmas:
                     MagmasWithInverseIfNonZero, and move this method
                     there?
                     """
-                    from sage.libs.gap.libgap import libgap
-                    fail = libgap.eval("fail")
+                    import mygap
+                    if mygap.deferred_arithmetic.depth:
+                        # The check for fail is delayed until evaluation
+                        return mygap.gap_operation(self.parent(), "Inverse", self)
                     inverse = self.gap().Inverse()
-                    if inverse == fail:
+                    if inverse == mygap.gap_fail:
                         raise ValueError("%s is not invertible"%self)
                     return self.parent()(inverse)
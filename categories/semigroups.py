@@ -25,39 +25,87 @@ class Semigroups:
                     [0 6], [16  1]
                     [16  0])
                 """
-                return tuple(self(handle) for handle in self.gap().GeneratorsOfSemigroup())
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.GAP.ParentMethods.semigroup_generators",
+                                          "GeneratorsOfSemigroup", (self,),
+                                          lambda handles: tuple(self(handle) for handle in handles))
 
             def __truediv__(self, relations):
                 return self._wrap( self.gap() / libgap([[x.gap(), y.gap()] for x,y in relations]) )
 
             def is_l_trivial(self):
-                return self.gap().IsLTrivial().sage()
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.GAP.ParentMethods.is_l_trivial", "IsLTrivial", (self,))
 
             def is_r_trivial(self):
-                return self.gap().IsRTrivial().sage()
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.GAP.ParentMethods.is_r_trivial", "IsRTrivial", (self,))
 
             def is_d_trivial(self):
-                return self.gap().IsDTrivial().sage()
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.GAP.ParentMethods.is_d_trivial", "IsDTrivial", (self,))
 
     class Finite:
         class ParentMethods:
             def j_classes(self):
-                return self._wrap(self.gap().JClasses())
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.Finite.ParentMethods.j_classes",
+                                          "JClasses", (self,), self._wrap)
 
             def l_classes(self):
-                return self._wrap(self.gap().LClasses())
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.Finite.ParentMethods.l_classes",
+                                          "LClasses", (self,), self._wrap)
 
             def r_classes(self):
-                return self._wrap(self.gap().RClasses())
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.Finite.ParentMethods.r_classes",
+                                          "RClasses", (self,), self._wrap)
+
+            def j_class_sizes(self):
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.Finite.ParentMethods.j_class_sizes",
+                                          "JClasses", (self,),
+                                          lambda classes: [c.Size().sage() for c in classes])
 
             def structure_description_maximal_subgroups(self):
-                return self._wrap(self.gap().StructureDescriptionMaximalSubgroups())
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.Finite.ParentMethods.structure_description_maximal_subgroups",
+                                          "StructureDescriptionMaximalSubgroups", (self,))
 
             def structure_description_schutzenberger_groups(self):
-                return self._wrap(self.gap().StructureDescriptionSchutzenbergerGroups())
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.Finite.ParentMethods.structure_description_schutzenberger_groups",
+                                          "StructureDescriptionSchutzenbergerGroups", (self,), self._wrap)
 
             def isomorphism_transformation_semigroup(self):
-                return self._wrap(self.gap().IsomorphismTransformationSemigroup())
+                from mygap import call_gap_operation
+                return call_gap_operation("Semigroups.Finite.ParentMethods.isomorphism_transformation_semigroup",
+                                          "IsomorphismTransformationSemigroup", (self,), self._wrap)
+
+            @cached_method
+            def froidure_pin(self):
+                r"""
+                Return a NumPy based Froidure-Pin enumeration of this transformation semigroup.
+
+                The enumeration runs in Python, on the image arrays of
+                the transformations; semantic handles on the elements
+                are only created on demand. See :mod:`froidure_pin`.
+
+                EXAMPLES::
+
+                    sage: from mygap import mygap
+                    sage: M = mygap.FullTransformationMonoid(4)
+                    sage: E = M.froidure_pin(); E
+                    Froidure-Pin enumeration of a semigroup of 256 transformations of degree 4
+                    sage: len(E.idempotents())
+                    41
+                    sage: E.element(E.idempotents()[0]).parent() is M
+                    True
+                """
+                from froidure_pin import FroidurePin
+                from mygap_numpy import to_numpy
+                return FroidurePin(to_numpy(self.gap().GeneratorsOfSemigroup()), parent=self)
 
     class Unital:
         class GAP(CategoryWithAxiom):
@@ -78,10 +126,15 @@ class Semigroups:
                         sage: SL(2, 17).is_abelian()
                         False
                     """
-                    return tuple(self(handle) for handle in self.gap().GeneratorsOfMonoid())
+                    from mygap import call_gap_operation
+                    return call_gap_operation("Semigroups.Unital.GAP.ParentMethods.monoid_generators",
+                                              "GeneratorsOfMonoid", (self,),
+                                              lambda handles: tuple(self(handle) for handle in handles))
 
         class Finite:
             class GAP(CategoryWithAxiom):
                 class ParentMethods:
                     def isomorphism_transformation_monoid(self):
-                        return self._wrap(self.gap().IsomorphismTransformationMonoid())
+                        from mygap import call_gap_operation
+                        return call_gap_operation("Semigroups.Unital.Finite.GAP.ParentMethods.isomorphism_transformation_monoid",
+                                                  "IsomorphismTransformationMonoid", (self,), self._wrap)
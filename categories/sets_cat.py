@@ -6,10 +6,12 @@ class Sets:
         class ParentMethods:
 
             def is_finite(self):
-                return self.gap().IsFinite().sage()
+                from mygap import call_gap_operation
+                return call_gap_operation("Sets.GAP.ParentMethods.is_finite", "IsFinite", (self,))
 
             def cardinality(self):
-                return self.gap().Size().sage()
+                from mygap import call_gap_operation
+                return call_gap_operation("Sets.GAP.ParentMethods.cardinality", "Size", (self,))
 
             def _an_element_(self):
                 """
@@ -21,7 +23,8 @@ class Sets:
                     sage: mygap.SymmetricGroup(3).an_element()
                     (1,2,3)
                 """
-                return self(self.gap().Representative())
+                from mygap import call_gap_operation
+                return call_gap_operation("Sets.GAP.ParentMethods._an_element_", "Representative", (self,), self)
 
             def random_element(self):
                 """
@@ -51,7 +54,8 @@ class Sets:
                     sage: G.random_element() in G
                     True
                 """
-                return self(self.gap().Random())
+                from mygap import call_gap_operation
+                return call_gap_operation("Sets.GAP.ParentMethods.random_element", "Random", (self,), self)
 
 
     class Finite:
@@ -59,3 +63,35 @@ class Sets:
             class ParentMethods:
                 def list(self):
                     return [self(handle) for handle in self.gap().List()]
+
+                def to_numpy(self, elements=None, degree=None):
+                    """
+                    Return the array of the images of the elements of this set of permutations or transformations.
+
+                    INPUT:
+
+                    - ``elements`` -- a list of elements of ``self`` or
+                      ``None`` (default); if ``None``, all the elements of
+                      ``self``, in the order of :meth:`list`
+                    - ``degree`` -- the number of points on which to take
+                      the images (default: the largest moved point, or the
+                      degree of the transformations)
+
+                    The images are 0-based, and computed by a single GAP
+                    call; see :func:`mygap_numpy.to_numpy`.
+
+                    EXAMPLES::
+
+                        sage: from mygap import mygap
+                        sage: G = mygap.SymmetricGroup(8)
+                        sage: a = G.to_numpy(); a.shape, a.dtype
+                        ((40320, 8), dtype('uint8'))
+                        sage: M = mygap.FullTransformationMonoid(3)
+                        sage: M.to_numpy([M.one(), M.an_element()])      # random
+                        array([[0, 1, 2],
+                               [0, 0, 0]], dtype=uint8)
+                        sage: M.to_numpy().shape
+                        (27, 3)
+                    """
+                    from mygap_numpy import to_numpy
+                    return to_numpy(self if elements is None else elements, degree)
@@ -0,0 +1,263 @@
+r"""
+A NumPy based Froidure-Pin enumeration of transformation semigroups
+
+Enumerating a transformation semigroup through GAP handles, by
+:class:`mygap.GAPIterator` or ``list()``, creates one handle per
+element. :class:`FroidurePin` instead represents the transformations
+as the rows of a NumPy array of 0-based images, and runs the
+Froidure-Pin algorithm level by level: the products of all the
+elements of a given word length by all the generators are computed at
+once by NumPy indexing, and the new elements are detected by hashing
+the rows.
+
+The enumeration provides the elements, in short-lex order of their
+minimal words, together with these words, the right and left Cayley
+graphs, and the idempotents. Semantic handles on the elements are
+only created on demand.
+
+Transformations act on the right, as in GAP: the product `xy` maps
+`i` to `y(x(i))`.
+
+EXAMPLES::
+
+    sage: from mygap import mygap
+    sage: M = mygap.FullTransformationMonoid(3)
+    sage: E = M.froidure_pin()
+    sage: len(E)
+    27
+    sage: E.elements.shape, E.elements.dtype
+    ((27, 3), dtype('uint8'))
+    sage: len(E.idempotents())
+    10
+
+Elements are converted back and forth to semantic handles::
+
+    sage: x = E.element(5); x                          # random
+    Transformation( [ 2, 3, 2 ] )
+    sage: x.parent() is M
+    True
+    sage: E.index(x)
+    5
+    sage: E.word(5)                                    # random
+    [1, 2]
+    sage: prod(E.generators_handles()[a] for a in E.word(5)) == x
+    True
+"""
+import numpy
+
+import mygap
+from mygap_numpy import image_dtype, to_numpy, transformations_from_array
+
+class FroidurePin(object):
+    r"""
+    The Froidure-Pin enumeration of the semigroup generated by some transformations.
+
+    INPUT:
+
+    - ``generators`` -- a 2-dimensional NumPy integer array of shape
+      ``(g, n)`` whose rows are the 0-based images of the generators
+    - ``parent`` -- a semantic handle on the semigroup or ``None``
+      (default); used to create the semantic handles of the elements;
+      if ``None``, a GAP semigroup is built from the generators when
+      needed
+
+    The enumeration is run upon creation.
+
+    ATTRIBUTES:
+
+    - ``elements`` -- the array of shape ``(N, n)`` of the elements
+    - ``right`` -- the right Cayley graph: the array of shape ``(N, g)``
+      whose entry `(i, a)` is the index of the product of the element
+      `i` by the generator `a`
+    - ``prefix``, ``last`` -- arrays of length ``N``: the element `i` is
+      the product of the element ``prefix[i]`` by the generator
+      ``last[i]``; ``prefix[i]`` is `-1` for the elements that are
+      generators
+
+    EXAMPLES::
+
+        sage: import numpy
+        sage: from froidure_pin import FroidurePin
+        sage: E = FroidurePin(numpy.array([[1, 0, 2], [1, 2, 0], [0, 0, 2]]))
+        sage: len(E)
+        27
+        sage: E.right.shape
+        (27, 3)
+        sage: E.right[E.index_of_images([1, 0, 2]), 0] == E.index_of_images([0, 1, 2])
+        True
+
+    The left Cayley graph is computed on demand::
+
+        sage: E.left.shape
+        (27, 3)
+        sage: i = E.index_of_images([1, 2, 0])
+        sage: E.elements[E.left[i, 2]]
+        array([1, 1, 0], dtype=uint8)
+    """
+    def __init__(self, generators, parent=None):
+        generators = numpy.asarray(generators)
+        if generators.ndim != 2 or not len(generators):
+            raise ValueError("expected a non empty 2-dimensional array of generators")
+        self.degree = n = generators.shape[1]
+        self.generators = numpy.ascontiguousarray(generators, dtype=image_dtype(n))
+        self._parent = parent
+        self._handles = {}
+        if n ** n < 2**63:
+            # Rows are encoded as integers in base n
+            self._powers = n ** numpy.arange(n, dtype=numpy.int64)
+        else:
+            self._powers = None
+        self._run()
+
+    def _keys(self, rows):
+        """
+        Return the list of the hashable keys of the rows of the array ``rows``.
+        """
+        if self._powers is not None:
+            return (rows.astype(numpy.int64) @ self._powers).tolist()
+        rows = numpy.ascontiguousarray(rows)
+        return [row.tobytes() for row in rows]
+
+    def _run(self):
+        gens = self.generators
+        g, n = gens.shape
+        index = {}
+        levels = []                     # the arrays of elements of each word length
+        prefix = []
+        last = []
+        right = []
+
+        # Generators
+        self._generator_indices = numpy.empty(g, dtype=numpy.int64)
+        new = []
+        for a, key in enumerate(self._keys(gens)):
+            i = index.get(key)
+            if i is None:
+                i = index[key] = len(index)
+                new.append(a)
+                prefix.append(-1)
+                last.append(a)
+            self._generator_indices[a] = i
+        level = gens[new]
+        start = 0
+
+        while len(level):
+            levels.append(level)
+            m = len(level)
+            # products[u, a] = level[u] * gens[a]
+            products = gens[numpy.arange(g)[None, :, None], level[:, None, :]]
+            products = products.reshape(m * g, n)
+            targets = numpy.empty(m * g, dtype=numpy.int64)
+            new = []
+            for k, key in enumerate(self._keys(products)):
+                i = index.get(key)
+                if i is None:
+                    i = index[key] = len(index)
+                    new.append(k)
+                    prefix.append(start + k // g)
+                    last.append(k % g)
+                targets[k] = i
+            right.append(targets.reshape(m, g))
+            start += m
+            level = products[new]
+
+        self._index = index
+        self.elements = numpy.ascontiguousarray(numpy.concatenate(levels))
+        self.right = numpy.concatenate(right)
+        self.prefix = numpy.array(prefix, dtype=numpy.int64)
+        self.last = numpy.array(last, dtype=numpy.int64)
+        self._level_sizes = [len(level) for level in levels]
+        self._left = None
+
+    def __len__(self):
+        return len(self.elements)
+
+    def __repr__(self):
+        return "Froidure-Pin enumeration of a semigroup of {} transformations of degree {}".format(len(self), self.degree)
+
+    @property
+    def left(self):
+        """
+        The left Cayley graph: the array of shape ``(N, g)`` whose entry `(i, a)` is the index of the product of the generator `a` by the element `i`.
+
+        It is computed level by level from the right Cayley graph:
+        for `u = p b`, `a u = (a p) b`.
+        """
+        if self._left is None:
+            left = numpy.empty_like(self.right)
+            start = 0
+            for size in self._level_sizes:
+                level = numpy.arange(start, start + size)
+                if start == 0:
+                    # u = b is a generator: a u = a * b
+                    left[level] = self.right[self._generator_indices][:, self.last[level]].T
+                else:
+                    left[level] = self.right[left[self.prefix[level]], self.last[level][:, None]]
+                start += size
+            self._left = left
+        return self._left
+
+    def idempotents(self):
+        """
+        Return the array of the indices of the idempotents.
+        """
+        E = self.elements
+        return numpy.flatnonzero((numpy.take_along_axis(E, E.astype(numpy.intp), axis=1) == E).all(axis=1))
+
+    def word(self, i):
+        """
+        Return the minimal word in the generators of the element of index ``i``, as a list of generator indices.
+        """
+        word = []
+        while i != -1:
+            word.append(int(self.last[i]))
+            i = self.prefix[i]
+        word.reverse()
+        return word
+
+    def words(self):
+        """
+        Return an iterator over the minimal words of the elements, in order.
+        """
+        for i in range(len(self)):
+            yield self.word(i)
+
+    def index_of_images(self, images):
+        """
+        Return the index of the transformation with 0-based images ``images``.
+
+        A :class:`KeyError` is raised if it does not belong to the semigroup.
+        """
+        images = numpy.asarray(images, dtype=self.generators.dtype).reshape(1, self.degree)
+        return self._index[self._keys(images)[0]]
+
+    def parent(self):
+        """
+        Return the semantic handle on the semigroup.
+        """
+        if self._parent is None:
+            self._parent = mygap.mygap.Semigroup(transformations_from_array(self.generators))
+        return self._parent
+
+    def generators_handles(self):
+        """
+        Return the semantic handles of the generators.
+        """
+        return [self.element(i) for i in self._generator_indices]
+
+    def element(self, i):
+        """
+        Return the semantic handle of the element of index ``i``, creating it if needed.
+        """
+        i = int(i)
+        handle = self._handles.get(i)
+        if handle is None:
+            images = [int(image) + 1 for image in self.elements[i]]
+            handle = self._handles[i] = self.parent()(mygap.libgap.Transformation(images))
+        return handle
+
+    def index(self, x):
+        """
+        Return the index of the semantic handle ``x``.
+        """
+        return self.index_of_images(to_numpy([x], self.degree)[0])
@@ -29,19 +29,21 @@ EXAMPLES::
 Missing features
 ================
 
-We would want to use F.random_element from ``Sets.GAP``, not
-:class:`ModulesWithBasis` or :class:`FiniteEnumeratedSets`::
+The method resolution order picks F.random_element from
+:class:`ModulesWithBasis`, rather than from ``Sets.GAP``. Since the
+latter has a cost hint, the parent dispatches between both (see
+:class:`mygap.CostAwareMethod`)::
 
     sage: F = mygap.FiniteField(3); F
     GF(3)
     sage: F in Fields().Finite().Enumerated().GAP()
     True
-    sage: F.random_element.__module__
+    sage: type(F).random_element.__module__
     'sage.categories.modules_with_basis'
-    sage: F.random_element()
-    Traceback (most recent call last):
-    ...
-    AttributeError: ...
+    sage: F.random_element() in F
+    True
+    sage: F.random_element.decision()['choice']
+    'gap'
 
 Other issue: in GAP, a ring is considered as a free module over
 itself, and GAP fields are set according to be modules over rings with
@@ -251,13 +253,7 @@ def gap_handle(x):
         Maybe we just want, for x a glorified hand, libgap(x) to
         return the corresponding low level handle
     """
-    from mygap import GAPObject
-    if isinstance(x, (list, tuple)):
-        return libgap([gap_handle(y) for y in x])
-    elif isinstance(x, GAPObject):
-        return x.gap()
-    else:
-        return libgap(x)
+    return mygap.gap_handle(x)
 
 class MMTWrapMethod(MMTWrap):
     """
@@ -143,7 +143,7 @@ More examples of structure computations with finite semigroups::
     sage: T = mygap.FullTransformationMonoid(4)
 
     sage: T.structure_description_maximal_subgroups() # optional - semigroups
-    [ "1", "C2", "S3", "S4" ]
+    ['1', 'C2', 'S3', 'S4']
 
     sage: T.j_classes()
     [ <Green's D-class: Transformation( [ 1, 1, 1, 1 ] )>,
@@ -151,6 +151,9 @@ More examples of structure computations with finite semigroups::
       <Green's D-class: Transformation( [ 1, 1, 2, 3 ] )>,
       <Green's D-class: IdentityTransformation> ]
 
+    sage: T.j_class_sizes()
+    [4, 84, 144, 24]
+
     sage: R = T.r_classes()
     sage: R
     [ <Green's R-class: Transformation( [ 1, 1, 1, 1 ] )>,
@@ -176,7 +179,7 @@ Let's construct a variety of GAP parents to check that they pass all
 the generic tests; this means that they have a chance to behave
 reasonably as native Sage parents::
 
-    sage: skip = ["_test_pickling", "_test_elements"] # Pickling fails for now
+    sage: skip = ["_test_elements"]
 
     sage: F = mygap.eval("Cyclotomics"); F
     Cyclotomics
@@ -198,6 +201,15 @@ reasonably as native Sage parents::
     True
     sage: TestSuite(F).run(skip=skip) # not tested
 
+Finitely presented groups are unpickled with a new family of elements,
+and thus are not equal to the original ones (see
+:meth:`GAPParent.Element.__reduce__`)::
+
+    sage: F = mygap.FreeGroup("a", "b")
+    sage: a, b = F.group_generators()
+    sage: G = F / [a^2, b^3, (a*b)^5]
+    sage: TestSuite(G).run(skip=skip + ["_test_pickling"])
+
 Exploring functionalities from the Semigroups package::
 
     sage: H.is_r_trivial()                   # optional - semigroups
@@ -312,16 +324,19 @@ libGAP
 ------
 
 - Feature: Tracing mode allowing for reproducing the sequence of GAP
-  instructions corresponding to a sequence of Sage instructions::
+  instructions corresponding to a sequence of Sage instructions. This
+  is implemented for the calls made by the semantic layer (see
+  :meth:`MyGap.log`), but not yet for plain libgap::
 
-     sage: libgap.log(True)                   # todo: not implemented
+     sage: mygap.log(True)
      sage: G = mygap.SymmetricGroup(3)
-     sage: G.list()
-     [(), (1,3), (1,2,3), (2,3), (1,3,2), (1,2)]
+     sage: G.cardinality()
+     6
 
-     sage: print libgap.get_log()             # todo: not implemented
+     sage: print(mygap.get_log(times=False))
      $sage1 := SymmetricGroup(3);
-     Size($sage1)
+     $sage2 := Size($sage1);
+     sage: mygap.log(False)
 
   Applications:
   - Debugging the interface
@@ -361,11 +376,21 @@ Misc TODO
 - Merge libgap / mygap
 - Merging the code into Sage
 """
+import array
+import collections
+import functools
+import gc
 import itertools
+import json
+import re
 import textwrap
+import threading
+import time
+import weakref
 
 from recursive_monkey_patch import monkey_patch
-from sage.misc.cachefunc import cached_method
+from sage.misc.cachefunc import cached_method, CachedMethodCaller, CachedMethodCallerNoArgs
+from sage.misc.abstract_method import AbstractMethod
 from sage.misc.nested_class import nested_pickle
 from sage.misc.misc import attrcall
 from sage.categories.category import Category
@@ -412,6 +437,430 @@ sage.libs.gap.gap_functions.common_gap_functions.union(
 # Code
 ##############################################################################
 
+##############################################################################
+# Routing of the GAP calls through an executor
+
+# When set, all the operations on semantic handles are run through
+# this executor; see :mod:`mygap_executor`
+gap_executor = None
+
+def gap_call(f, *args, **kwds):
+    """
+    Return ``f(*args, **kwds)``, run through :data:`gap_executor` if set.
+
+    The call is never coalesced with other pending calls.
+    """
+    if gap_executor is None:
+        return f(*args, **kwds)
+    return gap_executor.call(f, *args, **kwds)
+
+def routed(f):
+    """
+    Decorator routing the calls to ``f`` through :func:`gap_call`.
+    """
+    @functools.wraps(f)
+    def wrapper(*args, **kwds):
+        if gap_executor is None:
+            return f(*args, **kwds)
+        return gap_executor.call(f, *args, **kwds)
+    return wrapper
+
+##############################################################################
+# Statistics on the calls to GAP
+
+clock = time.perf_counter
+
+class CallStatistics(object):
+    """
+    Counters on the calls to GAP made by the semantic layer.
+
+    For each instrumented entry point (e.g. a generated wrapper
+    method), this records the number of calls, the cumulative time,
+    the part of that time spent in GAP (the rest being spent in the
+    Python-side conversions and wrapping), and a latency histogram
+    with buckets ``[2^{k-1}, 2^k[`` microseconds.
+
+    Recording a call costs a dictionary lookup and a few additions;
+    hence the statistics are enabled by default. See
+    :meth:`MyGap.stats` for examples.
+    """
+    histogram_size = 32
+
+    def __init__(self):
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all the counters.
+        """
+        self._counters = {}
+
+    def record(self, name, time, gap_time):
+        """
+        Record a call to ``name`` that took ``time`` seconds, ``gap_time`` of which in GAP.
+        """
+        counter = self._counters.get(name)
+        if counter is None:
+            counter = self._counters[name] = [0, 0.0, 0.0, [0] * self.histogram_size]
+        counter[0] += 1
+        counter[1] += time
+        counter[2] += gap_time
+        counter[3][min(int(time * 1e6).bit_length(), self.histogram_size - 1)] += 1
+
+    def as_dict(self):
+        """
+        Return the counters as a dictionary.
+
+        The histograms are given as dictionaries mapping the upper
+        bound, in microseconds, of each nonempty bucket to its count.
+        """
+        return {
+            name: {
+                "calls": calls,
+                "time": time,
+                "gap_time": gap_time,
+                "conversion_time": time - gap_time,
+                "histogram": {2**k: count for k, count in enumerate(histogram) if count},
+            }
+            for name, (calls, time, gap_time, histogram) in self._counters.items()
+        }
+
+    def to_json(self):
+        """
+        Return the counters as a JSON string.
+        """
+        return json.dumps(self.as_dict(), sort_keys=True, indent=1)
+
+statistics = CallStatistics()
+
+##############################################################################
+# Tracing the calls to GAP
+
+_handle_obj = None
+
+class GAPLog(object):
+    """
+    A log of the calls to GAP made by the semantic layer.
+
+    Each call is recorded as a GAP statement, together with the wall
+    time it took; results are stored in variables ``$sage1``,
+    ``$sage2``, ... which are reused in the subsequent statements.
+    The log is therefore a GAP script that can be replayed, e.g. to
+    benchmark a computation in plain GAP, or to report an issue to
+    the GAP developers.
+
+    Objects that were not produced by a logged call are inserted in
+    the statements by their printed form.
+
+    The log keeps alive the GAP objects it has named; use :meth:`clear`
+    to release them. See :meth:`MyGap.log` for examples.
+    """
+    infix_operators = {
+        r"\+": "+",
+        r"\-": "-",
+        r"\*": "*",
+        r"\/": "/",
+        r"\^": "^",
+        r"\=": "=",
+        r"\<": "<",
+        "EQ": "=",
+        "LT": "<",
+        }
+
+    def __init__(self):
+        self.enabled = False
+        self.clear()
+
+    def clear(self):
+        """
+        Clear the log.
+        """
+        self._statements = []
+        self._names = {}
+        self._counter = 0
+
+    def _key(self, handle):
+        # The identity of the GAP object; the identity of ``handle``
+        # can't be used since libgap may create several Python handles
+        # for the same GAP object
+        global _handle_obj
+        if _handle_obj is None:
+            _handle_obj = libgap.eval("HANDLE_OBJ")
+        return int(_handle_obj(handle))
+
+    def expression(self, x):
+        """
+        Return a GAP expression for ``x`` in the log.
+
+        This is the name of the variable holding ``x`` if any, and
+        its printed form otherwise.
+        """
+        if isinstance(x, GAPObject):
+            x = x.gap()
+        elif not isinstance(x, GapElement):
+            x = libgap(x)
+        entry = self._names.get(self._key(x))
+        if entry is not None:
+            return entry[0]
+        return repr(x)
+
+    def record(self, expression, result=None, time=0.0):
+        """
+        Record a statement evaluating ``expression``.
+
+        INPUT:
+
+        - ``expression`` -- a string, or a pair ``(function_name, arguments)``
+        - ``result`` -- the libgap handle produced by the statement, if any
+        - ``time`` -- the wall time of the statement, in seconds
+        """
+        if not isinstance(expression, str):
+            function, args = expression
+            args = [self.expression(arg) for arg in args]
+            operator = self.infix_operators.get(function)
+            if operator is not None and len(args) == 2:
+                expression = "{} {} {}".format(args[0], operator, args[1])
+            else:
+                expression = "{}({})".format(function, ", ".join(args))
+        if isinstance(result, GapElement):
+            self._counter += 1
+            name = "$sage{}".format(self._counter)
+            self._names[self._key(result)] = (name, result)
+            expression = "{} := {}".format(name, expression)
+        self._statements.append((expression, time))
+
+    def script(self, times=True):
+        """
+        Return the log as a GAP script.
+
+        INPUT:
+
+        - ``times`` -- a boolean (default: ``True``); whether to
+          append the wall time of each statement as a comment
+        """
+        if times:
+            return "\n".join("{};  # {:.6f}s".format(expression, time)
+                             for expression, time in self._statements)
+        return "\n".join("{};".format(expression)
+                         for expression, time in self._statements)
+
+gap_log = GAPLog()
+
+##############################################################################
+# Profiling the GAP functions called by the semantic layer
+
+# The profile being collected, if any; see :meth:`MyGap.profile`
+gap_profile = None
+
+class GAPProfile(object):
+    """
+    A profile of the GAP functions run on behalf of the semantic layer.
+
+    While the profile is active, GAP's function profiling is switched
+    on, and the time spent in each GAP function is attributed to the
+    Sage wrapper (category and method name) whose call triggered it;
+    the time spent in GAP outside of any wrapper is attributed to
+    ``"(outside wrappers)"``. This is merged with the Python-side
+    statistics of the wrappers (see :class:`CallStatistics`).
+
+    See :meth:`MyGap.profile` for examples.
+    """
+    outside = "(outside wrappers)"
+
+    # Reads and clears the profile counters of GAP; PROF_FUNC returns
+    # [calls, time with children, time without children, ...], in ms
+    _collect_code = """function()
+        local result, f, p;
+        result := [];
+        for f in PROFILED_FUNCTIONS do
+            p := PROF_FUNC(f);
+            if p[1] > 0 then
+                Add(result, [NameFunction(f), p[1], p[3], p[2]]);
+            fi;
+        od;
+        ClearProfile();
+        return result;
+    end"""
+    _collect_function = None
+
+    def __init__(self, display=True, limit=10):
+        self._display = display
+        self._limit = limit
+        self.gap_functions = {}
+        self.wrappers = {}
+
+    def collect(self, owner):
+        """
+        Attribute to ``owner`` the GAP function calls made since the previous collection.
+        """
+        if GAPProfile._collect_function is None:
+            GAPProfile._collect_function = libgap.eval(self._collect_code)
+        table = self.gap_functions.setdefault(owner, {})
+        for name, calls, time, cumulative_time in GAPProfile._collect_function().sage():
+            counter = table.setdefault(name, [0, 0, 0])
+            counter[0] += calls
+            counter[1] += time
+            counter[2] += cumulative_time
+
+    def __enter__(self):
+        global gap_profile
+        if gap_profile is not None:
+            raise RuntimeError("a GAP profile is already being collected")
+        self._statistics = statistics.as_dict()
+        libgap.ProfileGlobalFunctions(True)
+        libgap.ProfileOperationsAndMethods(True)
+        libgap.ClearProfile()
+        gap_profile = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global gap_profile
+        self.collect(self.outside)
+        gap_profile = None
+        libgap.ProfileOperationsAndMethods(False)
+        libgap.ProfileGlobalFunctions(False)
+        libgap.ClearProfile()
+        # Python-side statistics of the wrappers during the profile
+        before = self._statistics
+        for name, counter in statistics.as_dict().items():
+            previous = before.get(name, {"calls": 0, "time": 0.0, "gap_time": 0.0})
+            calls = counter["calls"] - previous["calls"]
+            if calls:
+                self.wrappers[name] = {
+                    "calls": calls,
+                    "time": counter["time"] - previous["time"],
+                    "gap_time": counter["gap_time"] - previous["gap_time"],
+                    }
+        if self._display:
+            print(self.report())
+
+    def report(self, limit=None):
+        """
+        Return the merged Python/GAP report as a string.
+
+        INPUT:
+
+        - ``limit`` -- the maximal number of GAP functions reported
+          for each wrapper (default: as specified at construction)
+
+        For each wrapper, this gives the number of calls, the total
+        time, and the times spent in GAP and in the Python-side
+        conversions; then, by decreasing self time, the GAP functions
+        that were run with their number of calls, self time and time
+        with children in milliseconds.
+        """
+        if limit is None:
+            limit = self._limit
+        owners = sorted(set(self.wrappers) | set(self.gap_functions),
+                        key=lambda owner: -self.wrappers.get(owner, {}).get("time", 0))
+        lines = []
+        for owner in owners:
+            counter = self.wrappers.get(owner)
+            if counter is None:
+                lines.append(owner)
+            else:
+                lines.append("{}: {} calls, {:.3f} ms (GAP: {:.3f} ms, conversion: {:.3f} ms)".format(
+                    owner, counter["calls"], 1000 * counter["time"], 1000 * counter["gap_time"],
+                    1000 * (counter["time"] - counter["gap_time"])))
+            table = self.gap_functions.get(owner, {})
+            functions = sorted(table.items(), key=lambda item: (-item[1][1], item[0]))
+            for name, (calls, time, cumulative_time) in functions[:limit]:
+                lines.append("    {:<40} {:>8} calls {:>8} ms {:>8} ms".format(name, calls, time, cumulative_time))
+        return "\n".join(lines)
+
+##############################################################################
+# Instrumented calls to GAP operations
+
+def call_gap_operation(qualname, gap_name, args, convert=attrcall("sage")):
+    """
+    Return the result of the GAP operation ``gap_name`` on ``args``, converted by ``convert``.
+
+    INPUT:
+
+    - ``qualname`` -- the qualified name of the calling method, like
+      ``"Sets.GAP.ParentMethods.cardinality"``
+    - ``gap_name`` -- the name of a GAP operation
+    - ``args`` -- a tuple of semantic handles or Sage objects
+    - ``convert`` -- a function converting the libgap result
+      (default: its ``sage`` method)
+
+    This is the common implementation of the generated wrappers and
+    of the hand written methods of :mod:`categories` calling a GAP
+    operation; the call is accounted for in :meth:`MyGap.stats`,
+    :meth:`MyGap.log` and :meth:`MyGap.profile` under ``qualname``.
+    When ``qualname`` is in :data:`pure_operations`, the result is
+    looked up in, and recorded to, the result store in use if any
+    (see :meth:`MyGap.use_result_store`).
+
+    EXAMPLES::
+
+        sage: from mygap import mygap, call_gap_operation
+        sage: G = mygap.SymmetricGroup(3)
+        sage: call_gap_operation("Sets.GAP.ParentMethods.cardinality", "Size", (G,))
+        6
+    """
+    if gap_executor is not None:
+        # Identical pending calls to pure operations are coalesced
+        return gap_executor.call(_call_gap_operation, qualname, gap_name, convert, *args,
+                                 coalesce=qualname in pure_operations)
+    return _call_gap_operation(qualname, gap_name, convert, *args)
+
+def _call_gap_operation(qualname, gap_name, convert, *args):
+    start = clock()
+    handles = [gap_handle(x) for x in args]
+    key = None
+    if result_store is not None and qualname in pure_operations:
+        key = result_store.key(gap_name, handles)
+        if key is not None:
+            result = result_store.lookup(key)
+            if result is not result_store.missing:
+                if statistics.enabled:
+                    statistics.record(qualname, clock() - start, 0.0)
+                return result
+    if gap_profile is not None:
+        gap_profile.collect(gap_profile.outside)
+    gap_start = clock()
+    result = getattr(libgap, gap_name)(*handles)
+    gap_time = clock() - gap_start
+    if gap_profile is not None:
+        gap_profile.collect(qualname)
+    if gap_log.enabled:
+        gap_log.record((gap_name, handles), result, gap_time)
+    result = convert(result)
+    if key is not None:
+        result_store.record(key, result)
+    if statistics.enabled:
+        statistics.record(qualname, clock() - start, gap_time)
+    return result
+
+##############################################################################
+# Persistent store of the results of pure wrappers
+
+# The store in use, if any; see :meth:`MyGap.use_result_store` and
+# :mod:`result_store`
+result_store = None
+
+# The qualified names of the methods whose result only depends on the
+# mathematical value of their arguments. Only methods returning plain
+# Sage values belong here: semantic handles in a stored result would
+# be unpickled into new parents, unrelated to the arguments. The
+# results are stored under the name of the GAP operation, which should
+# thus not be shared by two of these methods.
+pure_operations = {
+    "Sets.GAP.ParentMethods.cardinality",
+    "Sets.GAP.ParentMethods.is_finite",
+    "Groups.GAP.ParentMethods.is_abelian",
+    "Semigroups.GAP.ParentMethods.is_l_trivial",
+    "Semigroups.GAP.ParentMethods.is_r_trivial",
+    "Semigroups.GAP.ParentMethods.is_d_trivial",
+    "Semigroups.Finite.ParentMethods.j_class_sizes",
+    "Semigroups.Finite.ParentMethods.structure_description_maximal_subgroups",
+}
+
+##############################################################################
+
+@routed
 def GAP(gap_handle):
     """
     EXAMPLES::
@@ -429,18 +878,53 @@ def GAP(gap_handle):
 class MyGap(object):
 
     class Function:
-        def __init__(self, f):
+        def __init__(self, f, name=None):
             self._f = f
+            self._gap_name = name
+            self._name = "mygap.{}".format(name)
 
+        @routed
         def __call__(self, *args):
-            return GAP(self._f(*args))
+            if gap_profile is not None:
+                gap_profile.collect(gap_profile.outside)
+            start = clock()
+            handle = self._f(*args)
+            gap_time = clock() - start
+            if gap_profile is not None:
+                gap_profile.collect(self._name)
+            if gap_log.enabled:
+                gap_log.record((self._gap_name, args), handle, gap_time)
+            result = GAP(handle)
+            if statistics.enabled:
+                statistics.record(self._name, clock() - start, gap_time)
+            return result
 
     def __getattr__(self, name):
-        return self.Function(libgap.__getattr__(name))
+        """
+        Return a wrapper around the GAP function ``name``.
+
+        The wrapper is memoized: subsequent lookups of ``name`` don't
+        go through ``libgap`` again. Hence, rebinding the GAP global
+        variable ``name`` is not seen by ``mygap.<name>``.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: mygap.SymmetricGroup is mygap.SymmetricGroup
+            True
+        """
+        function = self.Function(libgap.__getattr__(name), name)
+        self.__dict__[name] = function
+        return function
 
+    @routed
     def __call__(self, *args):
-        return GAP(libgap(*args))
+        handle = libgap(*args)
+        if gap_log.enabled:
+            gap_log.record(repr(handle), handle)
+        return GAP(handle)
 
+    @routed
     def eval(self, code):
         """
         Return a semantic handle on the result of evaluating ``code`` in GAP.
@@ -455,193 +939,872 @@ class MyGap(object):
             sage: C in Fields().Infinite().GAP()
             True
         """
-        return GAP(libgap.eval(code))
+        start = clock()
+        handle = libgap.eval(code)
+        if gap_log.enabled:
+            gap_log.record(code.strip().rstrip(";"), handle, clock() - start)
+        return GAP(handle)
 
-mygap = MyGap()
+    def compile(self, template):
+        """
+        Return a callable evaluating the GAP expression ``template`` on its arguments.
 
+        INPUT:
 
-##############################################################################
-# Classes for semantic handles
+        - ``template`` -- a string: a GAP expression where ``$1``,
+          ``$2``, ... stand for the arguments
 
-class GAPObject(object):
-    def __init__(self, gap_handle, category=None):
-        """
+        The expression is parsed once into a GAP function; compiling
+        the same template again returns the same callable. Its
+        results are wrapped into semantic handles.
 
         EXAMPLES::
 
-            sage: from mygap import mygap, GAPObject
+            sage: from mygap import mygap
+            sage: number_of_r_classes = mygap.compile("Size(GreensRClasses($1))")
+            sage: number_of_r_classes
+            mygap.compile('Size(GreensRClasses($1))')
+            sage: [number_of_r_classes(mygap.FullTransformationMonoid(n)) for n in range(1, 4)]
+            [1, 2, 5]
+            sage: mygap.compile("Size(GreensRClasses($1))") is number_of_r_classes
+            True
 
-            sage: GAPObject(libgap.FreeGroup(3))
-            <mygap.GAPObject object at ...>
-            sage: GAPObject(0)
-            Traceback (most recent call last):
-            ...
-            ValueError: Not a handle to a gap object: 0
+        Arguments can also be libgap handles or Sage objects::
 
-            sage: G = mygap.FreeGroup(3)
-            sage: G(0)
+            sage: binomial = mygap.compile("Binomial($1, $2)")
+            sage: binomial(10, 3)
+            120
+            sage: binomial(10)
             Traceback (most recent call last):
             ...
-            ValueError: Not a handle to a gap object: 0
+            TypeError: mygap.compile('Binomial($1, $2)') takes 2 arguments (1 given)
         """
-        if not isinstance(gap_handle, GapElement):
-            raise ValueError("Not a handle to a gap object: %s"%gap_handle)
-        self._gap = gap_handle
+        compiled = compiled_templates.get(template)
+        if compiled is None:
+            compiled = compiled_templates[template] = CompiledExpression(template)
+        return compiled
 
-    def gap(self):
+    def permutations_from_array(self, array):
         """
-        Return the underlying libgap object.
-
-        EXAMPLES::
-
-            sage: from mygap import mygap
-            sage: t = mygap.Transformation([1,3,2])
-            sage: t1 = t._libgap_(); t1
-            Transformation( [ 1, 3, 2 ] )
-
-            sage: type(t1)
-            <type 'sage.libs.gap.element.GapElement'>
-
-        This hook is used by the ``libgap`` constructor::
-
-            sage: t2 = libgap(t); t2
-            Transformation( [ 1, 3, 2 ] )
-            sage: l = libgap([t, t, t]); l
-            [ Transformation( [ 1, 3, 2 ] ), Transformation( [ 1, 3, 2 ] ), Transformation( [ 1, 3, 2 ] ) ]
+        Return the list of the permutations given by the rows of the NumPy array ``array``.
 
-        TESTS:
+        See :func:`mygap_numpy.permutations_from_array`.
+        """
+        from mygap_numpy import permutations_from_array
+        return permutations_from_array(array)
 
-        Both ``t._libgap_()`` and ``libgap(t)``  return the underlying ``libgap`` object::
+    def transformations_from_array(self, array):
+        """
+        Return the list of the transformations given by the rows of the NumPy array ``array``.
 
-            sage: t1 is t2
-            True
+        See :func:`mygap_numpy.transformations_from_array`.
+        """
+        from mygap_numpy import transformations_from_array
+        return transformations_from_array(array)
 
-        Currently, ``libgap`` seems to make copies in the above list construction::
+    def matrices_from_array(self, array, field, encoding="integer"):
+        """
+        Return the list of the matrices over ``field`` given by the NumPy array ``array``.
 
-            sage: l[1] is t1
-            False
-            sage: l[1] == t1
-            True
+        See :func:`mygap_numpy.matrices_from_array`.
         """
-        return self._gap
-    _libgap_ = gap                 # TODO: do we want to use ._libgap_() instead of .gap() everywhere?
+        from mygap_numpy import matrices_from_array
+        return matrices_from_array(array, field, encoding)
 
-    def _repr_(self):
-        return repr(self.gap())
-    __repr__ = _repr_
+    def pool(self, processes=None, packages=()):
+        """
+        Return a pool of GAP worker processes.
 
-    def _wrap(self, obj):
-        return GAP(obj)
+        See :mod:`mygap_pool` for details.
 
-    @cached_method
-    def __hash__(self):
-        return hash(self._repr_())
+        EXAMPLES::
 
-    def __cmp__(self, other): # Would be nicer to provide id as sorting key ...
-        a = id(self)
-        b = id(other)
-        return (a > b) - (a < b)
+            sage: from mygap import mygap
+            sage: with mygap.pool(2) as pool:
+            ....:     pool.map("cardinality", [mygap.SymmetricGroup(3), mygap.FreeGroup(1)])
+            [6, +Infinity]
+        """
+        from mygap_pool import Pool
+        return Pool(processes, packages)
 
-    def __eq__(self, other):
+    def stats(self):
         """
-        Return whether ``self`` and ``other`` are equal.
+        Return statistics on the calls to GAP made by the semantic layer.
+
+        OUTPUT: a dictionary; see :class:`CallStatistics`
 
         EXAMPLES::
 
             sage: from mygap import mygap
-            sage: M = mygap.FreeMonoid(2)
-            sage: M.category()
-            Category of infinite g a p monoids
-            sage: m1, m2 = M.monoid_generators()
-            sage: m1 == m1
-            True
-            sage: m1 == m2
-            False
-            sage: m1*m2 == m2*m1
-            False
-            sage: m1*m2 == m1*m2
+            sage: mygap.reset_stats()
+            sage: G = mygap.SymmetricGroup(4)
+            sage: for i in range(3): c = G.cardinality()
+            sage: stats = mygap.stats()
+            sage: stats['mygap.SymmetricGroup']['calls']
+            1
+            sage: stats['retrieve_structure_of_gap_handle']['calls']
+            1
+            sage: s = stats['Sets.GAP.ParentMethods.cardinality']
+            sage: s['calls']
+            3
+            sage: s['gap_time'] + s['conversion_time'] == s['time']
             True
+            sage: sum(s['histogram'].values())
+            3
 
-            sage: H = M / [ [ m1^2, m1], [m2^2, m2], [m1*m2*m1, m2*m1*m2]]
-            sage: pi1, pi2 = H.monoid_generators()
-            sage: pi1^2 == pi1
-            True
-            sage: pi1*pi2*pi1 == pi2*pi1*pi2
-            True
+        The statistics can be exported in JSON::
 
-        TESTS::
+            sage: import json
+            sage: json.loads(mygap.dump_stats())['mygap.SymmetricGroup']['calls']
+            1
 
-            sage: M == M
-            True
-            sage: M == mygap.FreeMonoid(2)
-            False
-            sage: M == 0
-            False
+        and switched off::
+
+            sage: from mygap import statistics
+            sage: statistics.enabled = False
+            sage: mygap.reset_stats()
+            sage: G.cardinality()
+            24
+            sage: mygap.stats()
+            {}
+            sage: statistics.enabled = True
         """
-        return self.__class__ is other.__class__ and bool(self.gap().EQ(other.gap()))
+        return statistics.as_dict()
 
-    def __ne__(self, other):
-        return not self == other
+    def reset_stats(self):
+        """
+        Reset the statistics on the calls to GAP.
 
-@nested_pickle
-class GAPParent(GAPObject, Parent):
-    def __init__(self, gap_handle, category=Sets()):
-        Parent.__init__(self, category=category.GAP())
-        GAPObject.__init__(self, gap_handle)
+        See :meth:`stats`.
+        """
+        statistics.reset()
 
-    #def _element_constructor(self, gap_handle):
-    #    assert isinstance(gap_handle, sage.interfaces.gap.GapElement)
-    #    return self.element_class(self, gap_handle)
+    def dump_stats(self, file=None):
+        """
+        Return the statistics on the calls to GAP as a JSON string, or write them to ``file``.
 
-    def _refine_category_(self, category=None):
-        if category is None:
-            structure = retrieve_structure_of_gap_handle(self.gap())
-            assert structure.cls is GAPParent
-            category = structure.category
-        super(GAPParent, self)._refine_category_(category)
+        INPUT:
 
-    class Element(GAPObject, Element):
-        def __init__(self, parent, gap_handle):
-            """
-            Initialize an element of ``parent``
+        - ``file`` -- a file name or ``None``
 
-            .. TODO:: make this more robust
+        See :meth:`stats`.
+        """
+        result = statistics.to_json()
+        if file is None:
+            return result
+        with open(file, "w") as f:
+            f.write(result)
 
-            """
-            #from sage.libs.gap.element import GapElement
-            #if not isinstance(gap_handle, GapElement):
-            #    raise ValueError("Input not a GAP handle")
-            Element.__init__(self, parent)
-            GAPObject.__init__(self, gap_handle)
+    def log(self, enable=True):
+        """
+        Enable or disable the tracing of the calls to GAP made by the semantic layer.
 
-        def forget_parent(self):
-            return GAP(self.gap())
+        INPUT:
 
-class GAPMorphism(GAPObject): # TODO: inherit from morphism and move the methods to the categories
+        - ``enable`` -- a boolean (default: ``True``)
 
-    @cached_method
-    def domain(self):
-        return self._wrap(self.gap().Source())
+        The log is a replayable GAP script; see :class:`GAPLog`.
 
-    @cached_method
-    def codomain(self):
-        return self._wrap(self.gap().Range())
+        EXAMPLES::
 
-    def __call__(self, x):
-        return self.codomain()(self.gap().ImageElm(x.gap()))
+            sage: from mygap import mygap
+            sage: mygap.log(True)
+            sage: G = mygap.SymmetricGroup(4)
+            sage: G.cardinality()
+            24
+            sage: s, t = G.group_generators()
+            sage: s * t
+            (2,3,4)
+            sage: print(mygap.get_log(times=False))
+            $sage1 := SymmetricGroup(4);
+            $sage2 := Size($sage1);
+            $sage3 := GeneratorsOfGroup($sage1);
+            $sage4 := (1,2,3,4) * (1,2);
+            sage: mygap.log(False)
+
+        With the wall time of each statement::
+
+            sage: print(mygap.get_log())
+            $sage1 := SymmetricGroup(4);  # ...s
+            ...
 
-    def preimage(self, y):
-        return self.domain()(self.gap().PreImageElm(y.gap()))
+        Disabling the log does not clear it; use :meth:`clear_log`::
 
-class GAPIterator(GAPObject):
+            sage: mygap.clear_log()
+            sage: mygap.get_log()
+            ''
+        """
+        gap_log.enabled = enable
 
-    def __iter__(self):
+    def get_log(self, times=True):
         """
-        Return self, as per the iterator protocol.
+        Return the log of the calls to GAP as a GAP script.
 
-        TESTS::
+        INPUT:
 
-            sage: from mygap import GAPIterator
+        - ``times`` -- a boolean (default: ``True``); whether to
+          append the wall time of each statement as a comment
+
+        See :meth:`log`.
+        """
+        return gap_log.script(times)
+
+    def clear_log(self):
+        """
+        Clear the log of the calls to GAP.
+
+        See :meth:`log`.
+        """
+        gap_log.clear()
+
+    def profile(self, display=True, limit=10):
+        """
+        Return a context manager profiling the GAP functions run on behalf of the Sage wrappers.
+
+        INPUT:
+
+        - ``display`` -- a boolean (default: ``True``); whether to
+          print the report when leaving the context
+        - ``limit`` -- the maximal number of GAP functions reported
+          for each wrapper (default: 10)
+
+        See :class:`GAPProfile`.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: T = mygap.FullTransformationMonoid(4)
+            sage: with mygap.profile(limit=3):
+            ....:     T.cardinality()
+            256
+            Sets.GAP.ParentMethods.cardinality: 1 calls, ... ms (GAP: ... ms, conversion: ... ms)
+                Size ...
+            ...
+
+        The data remains available for further analysis::
+
+            sage: with mygap.profile(display=False) as profile:
+            ....:     R = T.r_classes()
+            sage: profile.wrappers                                      # random
+            {'Semigroups.Finite.ParentMethods.r_classes': {'calls': 1, 'time': 0.01, 'gap_time': 0.009},
+             'retrieve_structure_of_gap_handle': {'calls': 1, 'time': 0.001, 'gap_time': 0.0008}}
+            sage: sorted(profile.gap_functions['Semigroups.Finite.ParentMethods.r_classes'])      # random
+            ['GreensRClasses', ...]
+            sage: print(profile.report(limit=1))
+            Semigroups.Finite.ParentMethods.r_classes: 1 calls, ...
+        """
+        return GAPProfile(display, limit)
+
+    def use_result_store(self, path, **options):
+        """
+        Store the results of the pure wrappers in the sqlite database at ``path``, and return the store.
+
+        INPUT:
+
+        - ``path`` -- a path, or ``None`` to stop using a store
+        - ``options`` -- passed to :class:`result_store.ResultStore`
+
+        While a store is in use, the methods listed in
+        :data:`pure_operations` look up their result in the store
+        before calling GAP, and record it there afterwards. See
+        :mod:`result_store`.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: store = mygap.use_result_store(":memory:", max_entries=10); store
+            Result store at :memory:
+            sage: mygap.FullTransformationMonoid(3).cardinality()
+            27
+            sage: len(store) > 0
+            True
+            sage: mygap.use_result_store(None)
+        """
+        global result_store
+        if result_store is not None:
+            result_store.close()
+            result_store = None
+        if path is not None:
+            from result_store import ResultStore
+            result_store = ResultStore(path, **options)
+        return result_store
+
+    def scope(self):
+        """
+        Return a context manager releasing the semantic handles created within it.
+
+        This bounds the GAP memory used by long pipelines of temporaries.
+        See :class:`HandleScope`.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: M = mygap.FreeMonoid(2)
+            sage: m1, m2 = M.monoid_generators()
+            sage: with mygap.scope() as scope:
+            ....:     a = m1 * m2
+            ....:     b = a * a
+            ....:     c = scope.keep(b * m1)
+            sage: c
+            (m1*m2)^2*m1
+            sage: c.parent() is M
+            True
+
+        The other handles created within the scope have been released::
+
+            sage: a
+            <released GAP handle>
+            sage: a * m1
+            Traceback (most recent call last):
+            ...
+            ValueError: this GAP handle has been released by mygap.scope()
+
+        Handles created before entering the scope are untouched::
+
+            sage: m1 * m2
+            m1*m2
+
+        and so are the handles cached within the scope by the methods
+        of longer lived objects::
+
+            sage: G = mygap.SymmetricGroup(3)
+            sage: with mygap.scope():
+            ....:     s, t = G.group_generators()
+            sage: G.group_generators()
+            ((1,2,3), (1,2))
+
+        Scopes only track the handles created by their own thread::
+
+            sage: import threading
+            sage: results = []
+            sage: with mygap.scope():
+            ....:     thread = threading.Thread(target=lambda: results.append(mygap.SymmetricGroup(4)))
+            ....:     thread.start(); thread.join()
+            sage: results[0].cardinality()
+            24
+
+        .. WARNING::
+
+            Only the ``cached_method`` caches of the kept objects
+            and of the parents of the elements created within the scope
+            are searched; handles cached elsewhere, e.g. by a morphism
+            created outside of the scope, are released; call such
+            methods before entering the scope, or keep their results.
+        """
+        return HandleScope()
+
+    def memory_snapshot(self, collect=True, gap_memory=False):
+        """
+        Return a snapshot of the memory used by GAP and by the semantic handles.
+
+        See :class:`MemorySnapshot` for the description of the input.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: before = mygap.memory_snapshot()
+            sage: G = mygap.SymmetricGroup(5)
+            sage: elements = G.list()
+            sage: after = mygap.memory_snapshot(gap_memory=True)
+            sage: after                                         # random
+            GAP heap: live_bags=..., live_kb=..., total_kb=..., total_memory_allocated=...
+            Semantic handles:
+                       1  element of Category of finite g a p groups
+                       ...
+            Cached values: ... (... GAP objects, ... bytes)
+
+            sage: diff = after - before
+            sage: diff.handles
+            {'element of Category of finite g a p groups': 120,
+             'parent in Category of finite g a p groups': 1}
+            sage: diff.gap['total_memory_allocated'] > 0
+            True
+        """
+        return MemorySnapshot(collect=collect, gap_memory=gap_memory)
+
+    def track_memory(self, collect=True, gap_memory=False):
+        """
+        Return a context manager taking memory snapshots around a block of code.
+
+        See :class:`MemorySnapshot` for the description of the input.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: G = mygap.SymmetricGroup(4)
+            sage: with mygap.track_memory() as tracker:
+            ....:     x = G.an_element()
+            ....:     s = G.group_generators()
+            sage: tracker.diff.handles
+            {'element of Category of finite g a p groups': 3}
+            sage: tracker.diff.cached_values >= 2
+            True
+        """
+        return MemoryTracker(collect=collect, gap_memory=gap_memory)
+
+    def deferred(self):
+        r"""
+        Return a context manager within which arithmetic on GAP elements is deferred.
+
+        Within it, products, sums, differences, opposites and
+        inverses of GAP elements build a DAG of :class:`Expression`'s
+        instead of calling GAP. The DAG is evaluated by a single GAP
+        call when the handle of the result is needed (printing,
+        equality, hashing, conversion, ...), with common
+        subexpressions computed once. The intermediate elements are
+        never built.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: G = mygap.FreeGroup("a", "b")
+            sage: a, b = G.group_generators()
+            sage: mygap.reset_stats()
+            sage: with mygap.deferred():
+            ....:     c = a * b * a^-1 * b^-1
+            sage: c
+            a*b*a^-1*b^-1
+            sage: mygap.stats()['Expression.evaluate']['calls']
+            1
+
+        Elements built this way belong to the expected parent, and
+        can be used as any other::
+
+            sage: c.parent() is G
+            True
+            sage: c * c^-1
+            <identity ...>
+
+        Long sums are evaluated at once as well::
+
+            sage: F = mygap.FiniteField(7)
+            sage: x = F.one()
+            sage: with mygap.deferred():
+            ....:     s = sum(x for i in range(10)) - x
+            sage: s
+            Z(7)^2
+
+        Errors are reported upon evaluation::
+
+            sage: with mygap.deferred():
+            ....:     y = ~(x - x)
+            sage: y
+            Traceback (most recent call last):
+            ...
+            ValueError: an element of the deferred expression is not invertible
+
+        Deferring is local to the current thread; the arithmetic of
+        other threads is evaluated right away::
+
+            sage: import threading
+            sage: results = []
+            sage: with mygap.deferred():
+            ....:     thread = threading.Thread(target=lambda: results.append(a * b))
+            ....:     thread.start(); thread.join()
+            sage: results[0]._gap is None
+            False
+        """
+        return DeferredArithmetic()
+
+    def dispatch_decisions(self, parent):
+        """
+        Return the decisions of the cost aware methods of ``parent``.
+
+        OUTPUT: a dictionary mapping the name of each
+        :class:`CostAwareMethod` of ``parent`` to its decision
+
+        EXAMPLES:
+
+        ``random_element`` has a cost hint in ``Sets.GAP`` (see
+        :data:`gap_cost_hints`); for a GAP field, the generic
+        implementation from ``ModulesWithBasis`` would be used
+        otherwise::
+
+            sage: from mygap import mygap
+            sage: F = mygap.FiniteField(3)
+            sage: mygap.dispatch_decisions(F)['random_element']['choice'] is None
+            True
+            sage: F.random_element() in F
+            True
+            sage: mygap.dispatch_decisions(F)['random_element']['choice']
+            'gap'
+        """
+        return {name: method.decision()
+                for (name, method) in parent.__dict__.items()
+                if isinstance(method, CostAwareMethod)}
+
+mygap = MyGap()
+
+
+##############################################################################
+# Classes for semantic handles
+
+class GAPObject(object):
+    # The deferred expression for the handle, if not yet evaluated
+    _expression = None
+
+    def __init__(self, gap_handle, category=None):
+        """
+
+        EXAMPLES::
+
+            sage: from mygap import mygap, GAPObject
+
+            sage: GAPObject(libgap.FreeGroup(3))
+            <mygap.GAPObject object at ...>
+            sage: GAPObject(0)
+            Traceback (most recent call last):
+            ...
+            ValueError: Not a handle to a gap object: 0
+
+            sage: G = mygap.FreeGroup(3)
+            sage: G(0)
+            Traceback (most recent call last):
+            ...
+            ValueError: Not a handle to a gap object: 0
+        """
+        if isinstance(gap_handle, Expression):
+            self._gap = None
+            self._expression = gap_handle
+        elif not isinstance(gap_handle, GapElement):
+            raise ValueError("Not a handle to a gap object: %s"%gap_handle)
+        else:
+            self._gap = gap_handle
+        if handle_scopes.stack:
+            handle_scopes.stack[-1].track(self)
+
+    def gap(self):
+        """
+        Return the underlying libgap object.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: t = mygap.Transformation([1,3,2])
+            sage: t1 = t._libgap_(); t1
+            Transformation( [ 1, 3, 2 ] )
+
+            sage: type(t1)
+            <type 'sage.libs.gap.element.GapElement'>
+
+        This hook is used by the ``libgap`` constructor::
+
+            sage: t2 = libgap(t); t2
+            Transformation( [ 1, 3, 2 ] )
+            sage: l = libgap([t, t, t]); l
+            [ Transformation( [ 1, 3, 2 ] ), Transformation( [ 1, 3, 2 ] ), Transformation( [ 1, 3, 2 ] ) ]
+
+        TESTS:
+
+        Both ``t._libgap_()`` and ``libgap(t)``  return the underlying ``libgap`` object::
+
+            sage: t1 is t2
+            True
+
+        Currently, ``libgap`` seems to make copies in the above list construction::
+
+            sage: l[1] is t1
+            False
+            sage: l[1] == t1
+            True
+
+        The handle of an element built within :meth:`MyGap.deferred`
+        is computed on demand::
+
+            sage: M = mygap.FreeMonoid(2)
+            sage: m1, m2 = M.monoid_generators()
+            sage: with mygap.deferred():
+            ....:     x = m1 * m2 * m1
+            sage: x._gap is None
+            True
+            sage: x.gap()
+            m1*m2*m1
+        """
+        if self._gap is None:
+            self._gap = self._expression.evaluate()
+            self._expression = None
+        return self._gap
+    _libgap_ = gap                 # TODO: do we want to use ._libgap_() instead of .gap() everywhere?
+
+    @routed
+    def _repr_(self):
+        return repr(self.gap())
+    __repr__ = _repr_
+
+    def _wrap(self, obj):
+        return GAP(obj)
+
+    @cached_method
+    def __hash__(self):
+        return hash(self._repr_())
+
+    def __cmp__(self, other): # Would be nicer to provide id as sorting key ...
+        a = id(self)
+        b = id(other)
+        return (a > b) - (a < b)
+
+    def __eq__(self, other):
+        """
+        Return whether ``self`` and ``other`` are equal.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: M = mygap.FreeMonoid(2)
+            sage: M.category()
+            Category of infinite g a p monoids
+            sage: m1, m2 = M.monoid_generators()
+            sage: m1 == m1
+            True
+            sage: m1 == m2
+            False
+            sage: m1*m2 == m2*m1
+            False
+            sage: m1*m2 == m1*m2
+            True
+
+            sage: H = M / [ [ m1^2, m1], [m2^2, m2], [m1*m2*m1, m2*m1*m2]]
+            sage: pi1, pi2 = H.monoid_generators()
+            sage: pi1^2 == pi1
+            True
+            sage: pi1*pi2*pi1 == pi2*pi1*pi2
+            True
+
+        TESTS::
+
+            sage: M == M
+            True
+            sage: M == mygap.FreeMonoid(2)
+            False
+            sage: M == 0
+            False
+        """
+        if self.__class__ is not other.__class__:
+            return False
+        start = clock()
+        result = gap_call(self.gap().EQ, other.gap())
+        if gap_log.enabled:
+            gap_log.record(("EQ", [self, other]), time=clock() - start)
+        return bool(result)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        """
+        Pickle this handle as a serialized GAP object.
+
+        See :func:`gap_serialize`.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: x = mygap.eval("[1, 2, 3]")
+            sage: loads(dumps(x))
+            [ 1, 2, 3 ]
+        """
+        return (unpickle_gap_object, (gap_serialize(self),))
+
+@nested_pickle
+class GAPParent(GAPObject, Parent):
+    def __init__(self, gap_handle, category=Sets()):
+        Parent.__init__(self, category=category.GAP())
+        GAPObject.__init__(self, gap_handle)
+        self._install_cost_aware_methods()
+
+    @routed
+    def __reduce__(self):
+        """
+        Pickle this parent by its construction, or as a serialized GAP object, together with its category.
+
+        Permutation and matrix groups, and transformation semigroups
+        and monoids, are rebuilt from their generators, finite fields
+        from their size, and the domains held by GAP global variables,
+        like ``Cyclotomics``, by name; other parents are serialized
+        (see :func:`gap_serialize`). The category is
+        pickled as well, so that it is not retrieved again from GAP.
+
+        Within a pickle, the parent is only pickled once, and its
+        elements refer to it; see :meth:`GAPParent.Element.__reduce__`.
+
+        EXAMPLES::
+
+            sage: import pickle
+            sage: from mygap import mygap
+            sage: G = mygap.SymmetricGroup(5)
+            sage: H = loads(dumps(G)); H
+            Group([ (1,2,3,4,5), (1,2) ])
+            sage: H == G, H.category() == G.category()
+            (True, True)
+            sage: T = mygap.FullTransformationMonoid(3)
+            sage: loads(dumps(T)).cardinality()
+            27
+            sage: C = mygap.eval("Cyclotomics")
+            sage: loads(dumps(C)) == C
+            True
+
+        Free and finitely presented groups are serialized; the
+        unpickled group has a new family of elements, and is not equal
+        to the original one::
+
+            sage: F = mygap.FreeGroup("a", "b")
+            sage: loads(dumps(F))
+            <free group on the generators [ a, b ]>
+            sage: loads(dumps(F)) == F
+            False
+        """
+        construction = compiled_function(_construction)(self.gap())
+        if construction == gap_fail:
+            return (unpickle_gap_parent, (None, gap_serialize(self), self.category()))
+        name, generators = construction
+        return (unpickle_gap_parent, (name.sage(), gap_serialize(generators), self.category()))
+
+    #def _element_constructor(self, gap_handle):
+    #    assert isinstance(gap_handle, sage.interfaces.gap.GapElement)
+    #    return self.element_class(self, gap_handle)
+
+    @routed
+    def _refine_category_(self, category=None):
+        if category is None:
+            structure = retrieve_structure_of_gap_handle(self.gap())
+            assert structure.cls is GAPParent
+            category = structure.category
+        super(GAPParent, self)._refine_category_(category)
+        self._install_cost_aware_methods()
+
+    def _install_cost_aware_methods(self):
+        """
+        Install a :class:`CostAwareMethod` for each GAP implementation with a cost hint that competes with a generic implementation.
+        """
+        cls = type(self)
+        for (name, wrapper, cost) in cost_aware_methods:
+            if isinstance(self.__dict__.get(name), CostAwareMethod):
+                continue
+            # The methods of ParentMethods are copied into the parent
+            # classes of the categories; hence the identity test
+            implementations = [c.__dict__[name] for c in cls.__mro__ if name in c.__dict__]
+            if not any(method is wrapper for method in implementations):
+                continue
+            generic = next((method for method in implementations
+                            if method is not wrapper and not isinstance(method, AbstractMethod)),
+                           None)
+            if generic is None:
+                continue
+            self.__dict__[name] = CostAwareMethod(self, name,
+                                                  wrapper.__get__(self, cls),
+                                                  generic.__get__(self, cls),
+                                                  cost)
+
+    class Element(GAPObject, Element):
+        def __init__(self, parent, gap_handle):
+            """
+            Initialize an element of ``parent``
+
+            .. TODO:: make this more robust
+
+            """
+            #from sage.libs.gap.element import GapElement
+            #if not isinstance(gap_handle, GapElement):
+            #    raise ValueError("Input not a GAP handle")
+            Element.__init__(self, parent)
+            GAPObject.__init__(self, gap_handle)
+
+        def forget_parent(self):
+            return GAP(self.gap())
+
+        @routed
+        def __reduce__(self):
+            """
+            Pickle this element relative to its parent.
+
+            Permutations and transformations are pickled by their image
+            lists, and elements of free and finitely presented groups
+            or monoids by the letters of their words, packed in a
+            byte string (see :func:`pack_integers`); other elements
+            are serialized (see :func:`gap_serialize`).
+
+            EXAMPLES::
+
+                sage: import pickle
+                sage: from mygap import mygap
+                sage: G = mygap.SymmetricGroup(8)
+                sage: x = G.an_element()
+                sage: y = loads(dumps(x)); y
+                (1,2,3,4,5,6,7,8)
+                sage: y.parent().cardinality()
+                40320
+
+            The parent is pickled once; the elements take a few bytes
+            more than their images::
+
+                sage: L = G.list()
+                sage: data = pickle.dumps(L, protocol=4)
+                sage: len(data) < 32 * len(L)
+                True
+                sage: M = pickle.loads(data)
+                sage: M[0].parent() is M[-1].parent()
+                True
+                sage: [x.gap() for x in M] == [x.gap() for x in L]
+                True
+
+                sage: F = mygap.FreeGroup("a", "b")
+                sage: a, b = F.group_generators()
+                sage: G = F / [a^2, b^3, (a*b)^5]
+                sage: a, b = G.group_generators()
+                sage: loads(dumps(a * b^-1))
+                a*b^-1
+
+            .. WARNING::
+
+                Free and finitely presented groups and monoids are
+                unpickled as new GAP objects, with a new family of
+                elements; the unpickled parent and elements are thus
+                not equal to the original ones. Elements pickled
+                together, in a single pickle, share the same parent::
+
+                    sage: x = a * b^-1
+                    sage: loads(dumps(x)) == x
+                    False
+                    sage: y, z = loads(dumps((x, x^2)))
+                    sage: y^2 == z
+                    True
+            """
+            kind, data = compiled_function(_element_data)(self.gap())
+            kind = kind.sage()
+            if kind == 0:
+                data = b"\0\0" + gap_serialize(self)
+            else:
+                typecode, data = pack_integers(data.sage())
+                data = bytes([kind, ord(typecode)]) + data
+            return (unpickle_gap_element, (self.parent(), data))
+
+class GAPMorphism(GAPObject): # TODO: inherit from morphism and move the methods to the categories
+
+    @cached_method
+    def domain(self):
+        return self._wrap(gap_call(self.gap().Source))
+
+    @cached_method
+    def codomain(self):
+        return self._wrap(gap_call(self.gap().Range))
+
+    @routed
+    def __call__(self, x):
+        return self.codomain()(self.gap().ImageElm(x.gap()))
+
+    @routed
+    def preimage(self, y):
+        return self.domain()(self.gap().PreImageElm(y.gap()))
+
+class GAPIterator(GAPObject):
+
+    def __iter__(self):
+        """
+        Return self, as per the iterator protocol.
+
+        TESTS::
+
+            sage: from mygap import GAPIterator
             sage: l = libgap([1,3,2])
             sage: it = GAPIterator(l.Iterator())
             sage: it.__iter__() is it
@@ -650,35 +1813,663 @@ class GAPIterator(GAPObject):
         return self
 
 
-    def __next__(self):
+    def __next__(self):
+        """
+        Return the next object of this iterator or raise StopIteration, as
+        per the iterator protocol.
+
+        TESTS::
+
+            sage: from mygap import GAPIterator
+            sage: l = libgap([1,3,2])
+            sage: it = GAPIterator(l.Iterator())
+            sage: it.__next__()
+            1
+            sage: it.__next__()
+            3
+            sage: it.__next__()
+            2
+            sage: it.__next__()
+            Traceback (most recent call last):
+            ...
+            StopIteration
+
+            sage: for x in GAPIterator(l.Iterator()): print(x)
+            1
+            3
+            2
+        """
+        return gap_call(self._next)
+
+    def _next(self):
+        start = clock()
+        try:
+            if self.gap().IsDoneIterator():
+                raise StopIteration
+            result = self.gap().NextIterator()
+            if gap_log.enabled:
+                gap_log.record(("NextIterator", [self]), result, clock() - start)
+            return result
+        finally:
+            if statistics.enabled:
+                time = clock() - start
+                statistics.record("GAPIterator.__next__", time, time)
+
+class GAPList(GAPObject):
+    """
+    A semantic handle on a GAP list, whose items are wrapped on access.
+
+    INPUT:
+
+    - ``gap_handle`` -- a libgap handle on a GAP list
+    - ``universe`` -- a parent or ``None`` (default); if specified,
+      the items are wrapped as elements of ``universe``, and otherwise
+      by :func:`GAP`
+
+    This is meant for large lists, e.g. built in bulk by
+    :mod:`mygap_numpy`, where wrapping all the items upfront would
+    be costly. It can be passed as is to GAP functions.
+
+    EXAMPLES::
+
+        sage: from mygap import mygap, GAPList
+        sage: G = mygap.SymmetricGroup(3)
+        sage: l = GAPList(libgap.eval("[(1,2), (1,2,3)]"), universe=G); l
+        [ (1,2), (1,2,3) ]
+        sage: len(l)
+        2
+        sage: l[1]
+        (1,2,3)
+        sage: l[1].parent() is G
+        True
+        sage: l[-1] == l[1]
+        True
+        sage: l[:1]
+        [ (1,2) ]
+        sage: list(l)
+        [(1,2), (1,2,3)]
+        sage: mygap.Group(l).cardinality()
+        6
+    """
+    def __init__(self, gap_handle, universe=None):
+        GAPObject.__init__(self, gap_handle)
+        self._universe = universe
+
+    @routed
+    def _repr_(self):
+        if len(self) > 20:
+            return "<GAP list of {} items>".format(len(self))
+        return repr(self.gap())
+    __repr__ = _repr_
+
+    def __len__(self):
+        return len(self.gap())
+
+    def __reduce__(self):
+        return (unpickle_gap_object, (gap_serialize(self), GAPList, self._universe))
+
+    def _wrap_item(self, handle):
+        if self._universe is None:
+            return GAP(handle)
+        return self._universe(handle)
+
+    @routed
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return GAPList(libgap([self.gap()[j] for j in range(*i.indices(len(self)))]),
+                           self._universe)
+        if i < 0:
+            i += len(self)
+        return self._wrap_item(self.gap()[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_numpy(self, degree=None):
+        """
+        Return the array of the images of the permutations or transformations in this list.
+
+        See :func:`mygap_numpy.to_numpy`.
+
+        EXAMPLES::
+
+            sage: from mygap import GAPList
+            sage: GAPList(libgap.eval("[(1,2), (1,2,3)]")).to_numpy()
+            array([[1, 0, 2],
+                   [1, 2, 0]], dtype=uint8)
+        """
+        from mygap_numpy import to_numpy
+        return to_numpy(self, degree)
+
+##############################################################################
+# Scoped release of semantic handles
+
+class HandleScopes(threading.local):
+    """
+    The stack of the active scopes of the current thread; see :meth:`MyGap.scope`.
+
+    The GAP executor runs each call with the stack of the calling
+    thread (see :mod:`mygap_executor`).
+    """
+    def __init__(self):
+        self.stack = []
+
+handle_scopes = HandleScopes()
+
+def cached_gap_objects(obj):
+    """
+    Iterate over the semantic handles in the ``cached_method`` caches of ``obj``.
+
+    The cached values are searched one level deep into tuples and lists.
+    """
+    for value in getattr(obj, "__dict__", {}).values():
+        if isinstance(value, CachedMethodCallerNoArgs):
+            values = [] if value.cache is None else [value.cache]
+        elif isinstance(value, CachedMethodCaller):
+            values = list(value.cache.values())
+        else:
+            continue
+        for value in values:
+            for x in value if isinstance(value, (tuple, list)) else (value,):
+                if isinstance(x, GAPObject):
+                    yield x
+
+class ReleasedHandle(object):
+    """
+    The placeholder for the GAP handle of a released semantic handle.
+    """
+    def __getattr__(self, name):
+        raise ValueError("this GAP handle has been released by mygap.scope()")
+
+    def _libgap_(self):
+        raise ValueError("this GAP handle has been released by mygap.scope()")
+
+    def __repr__(self):
+        return "<released GAP handle>"
+
+released_handle = ReleasedHandle()
+
+class HandleScope(object):
+    """
+    A context manager releasing the semantic handles created within it.
+
+    On exit, the GAP handle of each semantic handle created within the
+    scope is dropped, unless the semantic handle was marked with
+    :meth:`keep`, or is cached by a method of a parent or object that
+    is not released (e.g. the generators of a group created outside
+    of the scope). This lets GAP reclaim the memory of temporaries
+    right away, without waiting for Python to collect their handles.
+
+    Scopes are local to each thread.
+
+    Using a released semantic handle raises a :class:`ValueError`.
+
+    See :meth:`MyGap.scope` for examples.
+    """
+    def __init__(self):
+        self._handles = []
+        self._kept = set()
+
+    def track(self, obj):
+        """
+        Track ``obj``, to be released on exit unless kept.
+        """
+        self._handles.append(weakref.ref(obj))
+
+    def keep(self, *objs):
+        """
+        Mark ``objs`` to be kept on exit, and return them.
+
+        The parents of kept elements are kept as well. When scopes are
+        nested, the kept objects are passed on to the enclosing scope.
+
+        OUTPUT: the object if a single one is given, and the tuple of the objects otherwise
+        """
+        for obj in objs:
+            self._kept.add(id(obj))
+            if isinstance(obj, Element):
+                self._kept.add(id(obj.parent()))
+        return objs[0] if len(objs) == 1 else objs
+
+    def __enter__(self):
+        handle_scopes.stack.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        scopes = handle_scopes.stack
+        scopes.pop()
+        objs = [obj for obj in (ref() for ref in self._handles) if obj is not None]
+        self._handles = []
+        # The objects in the caches of the surviving objects must
+        # survive as well; those are searched among the kept objects
+        # and the parents of the tracked elements
+        tracked = set(id(obj) for obj in objs)
+        kept = set(self._kept)
+        holders = [obj for obj in objs if id(obj) in kept]
+        holders.extend(obj.parent() for obj in objs if isinstance(obj, Element))
+        for holder in holders:
+            if id(holder) in kept or id(holder) not in tracked:
+                kept.update(id(x) for x in cached_gap_objects(holder))
+        for obj in objs:
+            if id(obj) in kept:
+                if scopes:
+                    scopes[-1].track(obj)
+            else:
+                obj._gap = released_handle
+
+##############################################################################
+# Deferred arithmetic on semantic handles
+
+class DeferredArithmeticDepth(threading.local):
+    """
+    The number of active :meth:`MyGap.deferred` contexts in the current thread.
+
+    The GAP executor runs each call with the depth of the calling
+    thread (see :mod:`mygap_executor`).
+    """
+    def __init__(self):
+        self.depth = 0
+
+deferred_arithmetic = DeferredArithmeticDepth()
+
+# The GAP syntax of the operations that can be deferred
+deferred_operations = {
+    r"\*": "{} * {}",
+    r"\+": "{} + {}",
+    r"\-": "{} - {}",
+    "AdditiveInverse": "AdditiveInverse({})",
+    "Inverse": "Inverse({})",
+}
+
+gap_fail = libgap.eval("fail")
+
+# The GAP functions compiled from the shapes of the expressions
+# evaluated so far and from the templates of :meth:`MyGap.compile`,
+# indexed by their source code
+compiled_expressions = {}
+
+def compiled_function(source):
+    """
+    Return the GAP function defined by ``source``, parsing it only once.
+    """
+    function = compiled_expressions.get(source)
+    if function is None:
+        function = compiled_expressions[source] = libgap.eval(source)
+    return function
+
+class Expression(object):
+    r"""
+    A node of a DAG of deferred GAP operations.
+
+    INPUT:
+
+    - ``operation`` -- a key of ``deferred_operations``
+    - ``operands`` -- a tuple of :class:`Expression`'s or libgap handles
+
+    The DAG is evaluated by a single call to a GAP function compiled
+    from its shape (see :meth:`compile`); the compiled functions are
+    cached, so that expressions of the same shape reuse them. The
+    value is stored in the node, which is then used as a leaf by the
+    expressions built on top of it.
+
+    EXAMPLES::
+
+        sage: from mygap import Expression
+        sage: a = libgap.eval("(1,2)"); b = libgap.eval("(2,3)")
+        sage: ab = Expression(r"\*", (a, b))
+        sage: e = Expression(r"\*", (ab, Expression("Inverse", (ab,))))
+        sage: print(e.compile()[0])
+        function(x1, x2)
+            local t1, t2, t3;
+            t1 := x1 * x2;
+            t2 := Inverse(t1);
+            if t2 = fail then return fail; fi;
+            t3 := t1 * t2;
+            return t3;
+        end
+        sage: e.evaluate()
+        ()
+    """
+    # Larger DAGs are evaluated as soon as they are built
+    max_size = 256
+
+    def __init__(self, operation, operands):
+        self.operation = operation
+        self.operands = operands
+        self.value = None
+        self.size = 1 + sum(operand.size for operand in operands
+                            if isinstance(operand, Expression))
+
+    def compile(self):
         """
-        Return the next object of this iterator or raise StopIteration, as
-        per the iterator protocol.
+        Return the source of a GAP function evaluating this DAG, and the list of its arguments.
 
-        TESTS::
+        Structurally identical subexpressions are computed once.
+        """
+        leaves = {}    # id of a handle -> its parameter
+        arguments = []
+        nodes = {}     # id of a node -> its variable
+        shapes = {}    # (operation, operand variables) -> variable
+        lines = []
+        # Iterative post-order traversal, to handle deep DAGs
+        stack = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in nodes:
+                continue
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((operand, False) for operand in reversed(node.operands)
+                             if isinstance(operand, Expression) and operand.value is None)
+                continue
+            variables = []
+            for operand in node.operands:
+                if isinstance(operand, Expression) and operand.value is None:
+                    variables.append(nodes[id(operand)])
+                    continue
+                if isinstance(operand, Expression):
+                    operand = operand.value
+                if id(operand) not in leaves:
+                    arguments.append(operand)
+                    leaves[id(operand)] = "x{}".format(len(arguments))
+                variables.append(leaves[id(operand)])
+            shape = (node.operation, tuple(variables))
+            if shape not in shapes:
+                variable = "t{}".format(len(shapes) + 1)
+                shapes[shape] = variable
+                lines.append("{} := {};".format(
+                    variable, deferred_operations[node.operation].format(*variables)))
+                if node.operation == "Inverse":
+                    lines.append("if {} = fail then return fail; fi;".format(variable))
+            nodes[id(node)] = shapes[shape]
+        lines.append("return {};".format(nodes[id(self)]))
+        source = "function({})\n    local {};\n    {}\nend".format(
+            ", ".join(leaves[id(argument)] for argument in arguments),
+            ", ".join(sorted(shapes.values(), key=lambda v: int(v[1:]))),
+            "\n    ".join(lines))
+        return source, arguments
+
+    def evaluate(self):
+        """
+        Return a libgap handle on the value of this DAG, evaluating it if needed.
+        """
+        if self.value is None:
+            source, arguments = self.compile()
+            function = compiled_function(source)
+            start = clock()
+            value = gap_call(function, *arguments)
+            time = clock() - start
+            if gap_log.enabled:
+                gap_log.record(("(" + source + ")", arguments), value, time)
+            if statistics.enabled:
+                statistics.record("Expression.evaluate", time, time)
+            if value == gap_fail:
+                raise ValueError("an element of the deferred expression is not invertible")
+            self.value = value
+            self.operands = ()
+        return self.value
+
+class DeferredArithmetic(object):
+    """
+    A context manager within which arithmetic on GAP elements is deferred.
 
-            sage: from mygap import GAPIterator
-            sage: l = libgap([1,3,2])
-            sage: it = GAPIterator(l.Iterator())
-            sage: it.__next__()
-            1
-            sage: it.__next__()
-            3
-            sage: it.__next__()
-            2
-            sage: it.__next__()
-            Traceback (most recent call last):
-            ...
-            StopIteration
+    See :meth:`MyGap.deferred`.
+    """
+    def __enter__(self):
+        deferred_arithmetic.depth += 1
+        return self
 
-            sage: for x in GAPIterator(l.Iterator()): print(x)
-            1
-            3
-            2
+    def __exit__(self, *exc_info):
+        deferred_arithmetic.depth -= 1
+
+def gap_operation(parent, operation, *operands):
+    """
+    Return the element of ``parent`` obtained by applying the GAP ``operation`` to ``operands``.
+
+    INPUT:
+
+    - ``operation`` -- a key of ``deferred_operations``
+    - ``operands`` -- semantic handles
+
+    Within :meth:`MyGap.deferred`, the operation is recorded in an
+    :class:`Expression`, and only evaluated when the handle of the
+    result is needed. Otherwise, it is evaluated right away.
+    """
+    if not deferred_arithmetic.depth:
+        return parent(getattr(libgap, operation)(*[operand.gap() for operand in operands]))
+    expression = Expression(operation, tuple(
+        operand.gap() if operand._expression is None else operand._expression
+        for operand in operands))
+    if expression.size > Expression.max_size:
+        expression.evaluate()
+    return parent.element_class(parent, expression)
+
+##############################################################################
+# Compiled GAP expressions
+
+class CompiledExpression(object):
+    r"""
+    A GAP expression with parameters ``$1``, ``$2``, ..., parsed once into a GAP function.
+
+    INPUT:
+
+    - ``template`` -- a string: a GAP expression where ``$1``, ``$2``,
+      ... stand for the arguments
+
+    Calling it with arguments (semantic handles, libgap handles or
+    Sage objects) returns a semantic handle on the value of the
+    expression. See :meth:`MyGap.compile` for examples.
+
+    .. NOTE::
+
+        The parameters are substituted textually, including within
+        GAP string literals.
+    """
+    parameter = re.compile(r"\$(\d+)")
+
+    def __init__(self, template):
+        self.template = template
+        indices = [int(i) for i in self.parameter.findall(template)]
+        self.arity = max(indices) if indices else 0
+        self.source = "function({}) return {}; end".format(
+            ", ".join("mygap_arg{}".format(i) for i in range(1, self.arity + 1)),
+            self.parameter.sub(r"mygap_arg\1", template.strip().rstrip(";")))
+        self._function = compiled_function(self.source)
+        self._name = "mygap.compile({!r})".format(template)
+
+    @routed
+    def __call__(self, *args):
+        if len(args) != self.arity:
+            raise TypeError("{} takes {} arguments ({} given)".format(self._name, self.arity, len(args)))
+        handles = [gap_handle(x) for x in args]
+        if gap_profile is not None:
+            gap_profile.collect(gap_profile.outside)
+        start = clock()
+        handle = self._function(*handles)
+        gap_time = clock() - start
+        if gap_profile is not None:
+            gap_profile.collect(self._name)
+        if gap_log.enabled:
+            gap_log.record(("(" + self.source + ")", handles), handle, gap_time)
+        result = GAP(handle)
+        if statistics.enabled:
+            statistics.record(self._name, clock() - start, gap_time)
+        return result
+
+    def __repr__(self):
+        return self._name
+
+# The compiled expressions, indexed by their template
+compiled_templates = {}
+
+##############################################################################
+# Memory instrumentation
+
+_gap_memory_statistics = None
+
+def gap_memory_statistics():
+    """
+    Return statistics on the GAP heap, as a dictionary.
+
+    The keys are:
+
+    - ``live_bags``, ``live_kb`` -- the number and total size of the
+      GAP objects that survived the last garbage collection
+    - ``total_kb`` -- the size of the GAP workspace
+    - ``total_memory_allocated`` -- the total number of bytes
+      allocated by GAP since its start
+
+    Those are only provided when the GAP kernel exposes them (e.g. not
+    when GAP is built with an alternative garbage collector).
+
+    EXAMPLES::
+
+        sage: from mygap import gap_memory_statistics
+        sage: stats = gap_memory_statistics()
+        sage: sorted(stats)                                  # random
+        ['live_bags', 'live_kb', 'total_kb', 'total_memory_allocated']
+        sage: stats['live_kb'] > 0
+        True
+    """
+    global _gap_memory_statistics
+    if _gap_memory_statistics is None:
+        _gap_memory_statistics = libgap.eval("""function()
+            local result, full;
+            result := rec();
+            if IsBoundGlobal("GasmanStatistics") then
+                full := ValueGlobal("GasmanStatistics")().full;
+                result.live_bags := full[1];
+                result.live_kb := full[2];
+                result.total_kb := full[6];
+            fi;
+            if IsBoundGlobal("TotalMemoryAllocated") then
+                result.total_memory_allocated := ValueGlobal("TotalMemoryAllocated")();
+            fi;
+            return result;
+        end""")
+    return _gap_memory_statistics().sage()
+
+class MemorySnapshot(object):
+    """
+    A snapshot of the memory used by GAP and by the semantic handles.
+
+    INPUT:
+
+    - ``collect`` -- a boolean (default: ``True``); whether to run the
+      Python and GAP garbage collectors before taking the snapshot
+    - ``gap_memory`` -- a boolean (default: ``False``); whether to
+      measure (with GAP's ``MemoryUsage``) the GAP memory retained by
+      the GAP objects held in cached results; this can be slow
+
+    ATTRIBUTES:
+
+    - ``gap`` -- the statistics on the GAP heap; see :func:`gap_memory_statistics`
+    - ``handles`` -- a dictionary mapping each kind of live semantic
+      handle (parents, elements, ... together with their category) to
+      their number
+    - ``cached_values`` -- the number of results stored in the caches
+      of the cached methods of the live semantic handles
+    - ``cached_gap_objects`` -- the number of GAP objects among them
+    - ``cached_gap_memory`` -- the GAP memory used by those, in bytes
+      (or ``None`` if not measured)
+
+    Snapshots can be subtracted; see :meth:`MyGap.memory_snapshot`.
+    """
+    def __init__(self, collect=True, gap_memory=False):
+        if collect:
+            gc.collect()
+            libgap.collect()
+        self.gap = gap_memory_statistics()
+        self.handles = {}
+        self.cached_values = 0
+        self.cached_gap_objects = 0
+        self.cached_gap_memory = 0 if gap_memory else None
+        cached_gap_handles = []
+        for obj in gc.get_objects():
+            if not isinstance(obj, GAPObject):
+                continue
+            kind = self._kind(obj)
+            self.handles[kind] = self.handles.get(kind, 0) + 1
+            for value in getattr(obj, "__dict__", {}).values():
+                if isinstance(value, CachedMethodCallerNoArgs):
+                    self.cached_values += value.cache is not None
+                elif isinstance(value, CachedMethodCaller):
+                    self.cached_values += len(value.cache)
+            for x in cached_gap_objects(obj):
+                self.cached_gap_objects += 1
+                cached_gap_handles.append(x)
+        if gap_memory:
+            memory_usage = libgap.MemoryUsage
+            self.cached_gap_memory = sum(int(memory_usage(x.gap())) for x in cached_gap_handles)
+
+    @staticmethod
+    def _kind(obj):
+        if isinstance(obj, Element):
+            return "element of {}".format(obj.parent().category())
+        if isinstance(obj, Parent):
+            return "parent in {}".format(obj.category())
+        return obj.__class__.__name__
+
+    def __sub__(self, other):
+        """
+        Return the difference between ``self`` and an earlier snapshot ``other``.
         """
-        if self.gap().IsDoneIterator():
-            raise StopIteration
-        return self.gap().NextIterator()
+        return MemoryDiff(self, other)
+
+    def __repr__(self):
+        lines = ["GAP heap: {}".format(", ".join("{}={}".format(key, value)
+                                                for key, value in sorted(self.gap.items())))]
+        lines.append("Semantic handles:")
+        for kind, count in sorted(self.handles.items()):
+            lines.append("    {:>8}  {}".format(count, kind))
+        lines.append("Cached values: {} ({} GAP objects{})".format(
+            self.cached_values, self.cached_gap_objects,
+            "" if self.cached_gap_memory is None else ", {} bytes".format(self.cached_gap_memory)))
+        return "\n".join(lines)
+
+class MemoryDiff(object):
+    """
+    The difference between two memory snapshots.
+
+    It has the same attributes as :class:`MemorySnapshot`, holding
+    the differences; only the kinds of handles whose number changed
+    are listed.
+    """
+    def __init__(self, after, before):
+        self.gap = {key: value - before.gap[key]
+                    for key, value in after.gap.items() if key in before.gap}
+        self.handles = {}
+        for kind in set(after.handles) | set(before.handles):
+            difference = after.handles.get(kind, 0) - before.handles.get(kind, 0)
+            if difference:
+                self.handles[kind] = difference
+        self.cached_values = after.cached_values - before.cached_values
+        self.cached_gap_objects = after.cached_gap_objects - before.cached_gap_objects
+        if after.cached_gap_memory is None or before.cached_gap_memory is None:
+            self.cached_gap_memory = None
+        else:
+            self.cached_gap_memory = after.cached_gap_memory - before.cached_gap_memory
+
+    __repr__ = MemorySnapshot.__repr__
+
+class MemoryTracker(object):
+    """
+    A context manager taking memory snapshots on entry and on exit.
+
+    See :meth:`MyGap.track_memory`.
+    """
+    def __init__(self, **options):
+        self._options = options
+        self.before = self.after = self.diff = None
+
+    def __enter__(self):
+        self.before = MemorySnapshot(**self._options)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.after = MemorySnapshot(**self._options)
+        self.diff = self.after - self.before
 
 ##############################################################################
 # Retrieving the structure (class + category) to use for a semantic
@@ -790,13 +2581,19 @@ def retrieve_structure_of_gap_handle(self):
         sage: mygap.eval("Cyclotomics") in Fields().Infinite().GAP()
         True
     """
+    start = clock()
+    gap_categories = self.CategoriesOfObject()
+    properties = self.KnownPropertiesOfObject()
+    true_properties = self.KnownTruePropertiesOfObject()
+    gap_time = clock() - start
+
     structure = Structure(GAPObject, Objects())
-    gap_categories = [str(cat) for cat in self.CategoriesOfObject()]
+    gap_categories = [str(cat) for cat in gap_categories]
     for cat in gap_categories:
         if cat in gap_category_to_structure:
             gap_category_to_structure[cat](structure)
-    properties = set(str(prop) for prop in self.KnownPropertiesOfObject())
-    true_properties = set(str(prop) for prop in self.KnownTruePropertiesOfObject())
+    properties = set(str(prop) for prop in properties)
+    true_properties = set(str(prop) for prop in true_properties)
     for prop in properties:
         if prop in true_properties:
             if prop in gap_category_to_structure:
@@ -814,6 +2611,8 @@ def retrieve_structure_of_gap_handle(self):
         structure.category = structure.category.Distributive()
     if "IsMagmaWithInversesIfNonzero" in gap_categories and structure.category.is_subcategory(Rings()):
         structure.category = structure.category.Division()
+    if statistics.enabled:
+        statistics.record("retrieve_structure_of_gap_handle", clock() - start, gap_time)
     return structure
 
 ##############################################################################
@@ -863,10 +2662,96 @@ def from_handle(type):
         return type
 
 ##############################################################################
+# Conversion of the arguments to GAP
+
+class ConversionCache(object):
+    """
+    A bounded cache of the conversions to GAP of immutable Sage objects.
+
+    INPUT:
+
+    - ``maxsize`` -- the maximal number of cached conversions; the
+      least recently used ones are evicted first
+
+    Objects are cached by type, parent and value, provided they are
+    hashable and, if they have an ``is_immutable`` method, immutable;
+    other objects are converted by ``libgap`` each time. The cached
+    GAP objects are made immutable, so that GAP functions can't
+    modify them in place.
+
+    EXAMPLES::
+
+        sage: from mygap import ConversionCache
+        sage: cache = ConversionCache(maxsize=2)
+        sage: m = matrix(QQ, [[1, 2], [3, 4]]); m.set_immutable()
+        sage: h = cache(m); h
+        [ [ 1, 2 ], [ 3, 4 ] ]
+        sage: cache(matrix(QQ, [[1, 2], [3, 4]], immutable=True)) is h
+        True
+        sage: h.IsMutable()
+        false
+
+    Mutable objects are not cached::
+
+        sage: cache(matrix(QQ, [[1, 2], [3, 4]])) is h
+        False
+        sage: cache.hits, cache.misses
+        (1, 1)
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.clear()
+
+    def clear(self):
+        """
+        Clear the cache and its counters.
+        """
+        self._cache = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, x):
+        """
+        Return the key of ``x`` in the cache, or ``None`` if ``x`` can't be cached.
+        """
+        is_immutable = getattr(x, "is_immutable", None)
+        if is_immutable is not None and not is_immutable():
+            return None
+        parent = x.parent() if isinstance(x, Element) else None
+        key = (type(x), parent, x)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def __call__(self, x):
+        """
+        Return a libgap handle on the conversion of ``x`` to GAP.
+        """
+        key = self.key(x)
+        if key is None:
+            return libgap(x)
+        handle = self._cache.pop(key, None)
+        if handle is None:
+            self.misses += 1
+            handle = libgap.MakeImmutable(libgap(x))
+            if len(self._cache) >= self.maxsize:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+        self._cache[key] = handle
+        return handle
+
+conversion_cache = ConversionCache()
+
 def gap_handle(x):
     """
     Return a low-level libgap handle to the corresponding GAP object.
 
+    Lists and tuples are converted by :func:`gap_list`, and immutable
+    Sage objects through :obj:`conversion_cache`.
+
     EXAMPLES::
 
         sage: from mygap import mygap, gap_handle
@@ -887,13 +2772,437 @@ def gap_handle(x):
         Maybe we just want, for x a glorified hand, libgap(x) to
         return the corresponding low level handle
     """
-    from mygap import GAPObject
     if isinstance(x, (list, tuple)):
-        return libgap([gap_handle(y) for y in x])
+        return gap_list(x)
     elif isinstance(x, GAPObject):
         return x.gap()
+    elif isinstance(x, GapElement):
+        return x
+    else:
+        return conversion_cache(x)
+
+def gap_list(l):
+    """
+    Return a libgap handle on the GAP list corresponding to the nested lists or tuples ``l``.
+
+    The nested lists are traversed iteratively, so that deeply nested
+    inputs don't hit the recursion limit. Each leaf is converted once
+    per call, however often it occurs, and the GAP list is built by a
+    single call to ``libgap``.
+
+    EXAMPLES::
+
+        sage: from mygap import mygap, gap_list
+        sage: G = mygap.SymmetricGroup(3)
+        sage: g = G.an_element()
+        sage: gap_list([[g, 1], (g, [2, 3/2]), []])
+        [ [ (1,2,3), 1 ], [ (1,2,3), [ 2, 3/2 ] ], [  ] ]
+    """
+    converted = {}          # id of a leaf -> its handle
+    result = []
+    stack = [(l, result)]
+    while stack:
+        source, target = stack.pop()
+        for x in source:
+            if isinstance(x, (list, tuple)):
+                sublist = []
+                target.append(sublist)
+                stack.append((x, sublist))
+                continue
+            handle = converted.get(id(x))
+            if handle is None:
+                handle = converted[id(x)] = gap_handle(x)
+            target.append(handle)
+    return libgap(result)
+
+##############################################################################
+# Serialization of GAP objects
+
+# GAP strings holding arbitrary bytes can't be converted through
+# ``libgap(str)`` / ``.sage()`` which go through utf-8; we thus
+# transport them as lists of integers
+_serialize_to_bytes = None
+_deserialize_from_bytes = None
+
+def gap_serialize(x):
+    """
+    Return a byte string from which :func:`gap_deserialize` rebuilds ``x``.
+
+    INPUT:
+
+    - ``x`` -- a semantic handle, a libgap handle, or anything that
+      can be converted to GAP by :func:`gap_handle`
+
+    This uses GAP's ``SerializeToNativeString``; the result can only
+    be deserialized by a GAP of the same version and architecture.
+
+    EXAMPLES::
+
+        sage: from mygap import mygap, gap_serialize, gap_deserialize
+        sage: G = mygap.SymmetricGroup(3)
+        sage: data = gap_serialize(G)
+        sage: type(data)
+        <class 'bytes'>
+        sage: gap_deserialize(data)
+        Sym( [ 1 .. 3 ] )
+        sage: gap_deserialize(gap_serialize([1, 3, 2]))
+        [ 1, 3, 2 ]
+    """
+    global _serialize_to_bytes
+    if _serialize_to_bytes is None:
+        _serialize_to_bytes = libgap.eval("x -> List(SerializeToNativeString(x), IntChar)")
+    return bytes(_serialize_to_bytes(gap_handle(x)).sage())
+
+def gap_deserialize(data):
+    """
+    Return a libgap handle on the GAP object serialized in ``data``.
+
+    INPUT:
+
+    - ``data`` -- a byte string as returned by :func:`gap_serialize`
+
+    See :func:`gap_serialize` for examples.
+    """
+    global _deserialize_from_bytes
+    if _deserialize_from_bytes is None:
+        _deserialize_from_bytes = libgap.eval("l -> DeserializeNativeString(List(l, CharInt))")
+    return _deserialize_from_bytes(list(bytearray(data)))
+
+##############################################################################
+# Pickling of semantic handles
+
+# Parents are pickled once per pickle stream (pickle memoizes them),
+# by their construction when they are given by generators, and
+# otherwise as a serialized GAP object, together with their category
+# so that it needs not be retrieved again. Elements are pickled
+# relative to their parent, as the integer array of their images or
+# of the letters of their word, packed in a byte string.
+
+# The name and generators of the parents that can be rebuilt from them,
+# or the name of the global variable holding them, with fail
+_construction = """function(P)
+    local name;
+    for name in ["Integers", "Rationals", "Cyclotomics", "GaussianIntegers",
+                 "GaussianRationals", "PositiveIntegers", "NonnegativeIntegers"] do
+        if IsIdenticalObj(P, ValueGlobal(name)) then
+            return [name, fail];
+        fi;
+    od;
+    if IsField(P) and IsFFECollection(P) and IsFinite(P) then
+        return ["GF", Size(P)];
+    elif IsGroup(P) and (IsPermCollection(P) or IsMatrixGroup(P)) and not IsEmpty(GeneratorsOfGroup(P)) then
+        return ["Group", GeneratorsOfGroup(P)];
+    elif IsTransformationSemigroup(P) and IsMonoid(P) and not IsEmpty(GeneratorsOfMonoid(P)) then
+        return ["Monoid", GeneratorsOfMonoid(P)];
+    elif IsTransformationSemigroup(P) then
+        return ["Semigroup", GeneratorsOfSemigroup(P)];
+    fi;
+    return fail;
+end"""
+_construct = """function(name, generators)
+    if generators = fail then
+        return ValueGlobal(name);
+    fi;
+    return ValueGlobal(name)(generators);
+end"""
+
+# The kind and integer data of an element; 0 stands for a serialized GAP object
+_element_data = """function(x)
+    if IsPerm(x) then
+        return [1, ListPerm(x)];
+    elif IsTransformation(x) then
+        return [2, ImageListOfTransformation(x, DegreeOfTransformation(x))];
+    elif IsElementOfFpGroup(x) then
+        return [3, LetterRepAssocWord(UnderlyingElement(x))];
+    elif IsAssocWord(x) then
+        return [4, LetterRepAssocWord(x)];
+    fi;
+    return [0, []];
+end"""
+_element_from_data = """function(P, kind, data)
+    if kind = 1 then
+        return PermList(data);
+    elif kind = 2 then
+        return Transformation(data);
+    elif kind = 3 then
+        return ElementOfFpGroup(ElementsFamily(FamilyObj(P)),
+                   AssocWordByLetterRep(FamilyObj(UnderlyingElement(One(P))), data));
+    elif kind = 4 then
+        return AssocWordByLetterRep(ElementsFamily(FamilyObj(P)), data);
+    fi;
+end"""
+
+def pack_integers(values):
+    r"""
+    Return a pair ``(typecode, data)`` packing the list of integers ``values`` in a byte string.
+
+    The smallest :mod:`array` type holding the values is used.
+
+    EXAMPLES::
+
+        sage: from mygap import pack_integers, unpack_integers
+        sage: pack_integers([3, 1, 2])
+        ('B', b'\x03\x01\x02')
+        sage: pack_integers([-1, 300])[0]
+        'h'
+        sage: unpack_integers(*pack_integers([-1, 300]))
+        [-1, 300]
+    """
+    values = [int(value) for value in values]
+    signed = values and min(values) < 0
+    for typecode in ("bhiq" if signed else "BHIQ"):
+        try:
+            return typecode, array.array(typecode, values).tobytes()
+        except OverflowError:
+            pass
+    raise OverflowError("the values do not fit in 64 bits")
+
+def unpack_integers(typecode, data):
+    """
+    Return the list of integers packed in ``data`` by :func:`pack_integers`.
+    """
+    values = array.array(typecode)
+    values.frombytes(data)
+    return values.tolist()
+
+def unpickle_gap_object(data, cls=None, *args):
+    """
+    Return the semantic handle on the GAP object serialized in ``data``.
+
+    INPUT:
+
+    - ``data`` -- a byte string as returned by :func:`gap_serialize`
+    - ``cls`` -- the class of the handle, or ``None`` (default) to
+      retrieve it with :func:`GAP`
+    - ``args`` -- further arguments for ``cls``
+    """
+    handle = gap_deserialize(data)
+    if cls is None:
+        return GAP(handle)
+    return cls(handle, *args)
+
+@routed
+def unpickle_gap_parent(construction, data, category):
+    """
+    Return the GAP parent pickled by :meth:`GAPParent.__reduce__`.
+    """
+    handle = gap_deserialize(data)
+    if construction is not None:
+        handle = compiled_function(_construct)(construction, handle)
+    return GAPParent(handle, category)
+
+@routed
+def unpickle_gap_element(parent, data):
+    """
+    Return the element of ``parent`` pickled by :meth:`GAPParent.Element.__reduce__`.
+
+    The first byte of ``data`` is the kind of the element, and the
+    second one the typecode of its packed integers, if any.
+    """
+    kind = data[0]
+    if kind == 0:
+        handle = gap_deserialize(data[2:])
     else:
-        return libgap(x)
+        values = unpack_integers(chr(data[1]), data[2:])
+        handle = compiled_function(_element_from_data)(parent.gap(), kind, values)
+    return parent(handle)
+
+##############################################################################
+# Cost aware dispatch between Sage generic and GAP implementations
+
+# The cost hints of the GAP implementations of parent methods, indexed
+# by their qualified name in the categories; they apply both to the
+# generated wrappers and to the hand written implementations of
+# :mod:`categories`. See :func:`register_cost_aware_method` for the format.
+gap_cost_hints = {
+    "Sets.GAP.ParentMethods.random_element": 1e-5,
+}
+
+# The GAP implementations of parent methods with a cost hint, as
+# tuples (name, implementation, cost)
+cost_aware_methods = []
+
+def register_cost_aware_method(name, wrapper, cost):
+    """
+    Register ``wrapper``, the GAP implementation of the parent method ``name``, for cost aware dispatch.
+
+    INPUT:
+
+    - ``cost`` -- the cost hint of the method (see
+      :data:`gap_cost_hints`): the estimated time, in seconds, of a
+      call to the GAP implementation; or a function computing it from
+      the parent; or a dictionary with keys ``"gap"`` and/or
+      ``"sage"`` giving such estimates for either implementation
+
+    See :class:`CostAwareMethod`.
+    """
+    cost_aware_methods.append((name, wrapper, cost))
+
+def register_cost_hinted_methods(module):
+    """
+    Register for cost aware dispatch the hand written GAP implementations of ``module`` with a cost hint.
+
+    INPUT:
+
+    - ``module`` -- a module of :mod:`categories`, whose classes
+      are named after the categories they extend
+
+    The implementations are looked up in ``module`` by the qualified
+    names of :data:`gap_cost_hints`.
+    """
+    for (qualname, cost) in gap_cost_hints.items():
+        method = module
+        try:
+            for name in qualname.split("."):
+                method = getattr(method, name)
+        except AttributeError:
+            continue
+        register_cost_aware_method(name, method, cost)
+
+class CostAwareMethod(object):
+    r"""
+    A method of a GAP parent dispatching between the GAP wrapper and the generic Sage implementation.
+
+    In a parent of ``C.GAP()``, the method resolution order decides
+    arbitrarily between the GAP implementation from
+    ``C.GAP().ParentMethods`` and a generic implementation from some
+    other category. When the former has a cost hint (see
+    :data:`gap_cost_hints`), the parent gets instead a
+    :class:`CostAwareMethod` choosing between both.
+
+    Each implementation is estimated by its mean measured time if it
+    has been called already, and by its cost hint otherwise (the
+    generic implementation defaults to ``default_cost``). Each call
+    goes to the implementation with the lowest estimate and is timed.
+    An implementation raising :class:`AttributeError` or
+    :class:`NotImplementedError` on its first call gets an infinite
+    cost, and the call falls back to the other one. Other errors, like
+    a :class:`TypeError` for bad arguments, are left to the caller.
+
+    The last decision is recorded, and can be inspected with
+    :meth:`MyGap.dispatch_decisions`.
+
+    EXAMPLES:
+
+    For a GAP field, the method resolution order picks
+    ``random_element`` from :class:`ModulesWithBasis`; the hand
+    written GAP implementation from ``Sets.GAP`` has a cost hint, and
+    gets called instead::
+
+        sage: from mygap import mygap
+        sage: F = mygap.FiniteField(3)
+        sage: type(F).random_element.__module__
+        'sage.categories.modules_with_basis'
+        sage: F.random_element
+        <cost aware method random_element of GF(3): None>
+        sage: F.random_element() in F
+        True
+        sage: F.random_element.decision()['choice'], F.random_element.decision()['calls']
+        ('gap', {'gap': 1, 'sage': 0})
+        sage: F.random_element.decision()['reason']             # random
+        'cost estimates: gap=1e-05s (hint), sage=0.001s (hint)'
+
+    Once measured, the estimates replace the hints::
+
+        sage: F.random_element.estimate("gap") != 1e-5
+        True
+        sage: F.random_element.estimate("sage")
+        0.001
+
+    Bad arguments don't disqualify an implementation::
+
+        sage: F.random_element(1, 2, 3)
+        Traceback (most recent call last):
+        ...
+        TypeError: ...
+        sage: F.random_element.estimate("gap") < float("inf")
+        True
+        sage: F.random_element.decision()['choice']
+        'gap'
+    """
+    implementations = ("gap", "sage")
+    default_cost = 1e-3
+    failures = (AttributeError, NotImplementedError)
+
+    def __init__(self, parent, name, gap_method, sage_method, cost):
+        self._parent_name = repr(parent)
+        self.__name__ = name
+        self.__doc__ = getattr(sage_method, "__doc__", None)
+        self._methods = {"gap": gap_method, "sage": sage_method}
+        if not isinstance(cost, dict):
+            cost = {"gap": cost}
+        self._hints = {}
+        for implementation in self.implementations:
+            hint = cost.get(implementation)
+            if callable(hint):
+                hint = hint(parent)
+            if hint is None and implementation == "sage":
+                hint = self.default_cost
+            self._hints[implementation] = hint
+        self._calls = {"gap": 0, "sage": 0}
+        self._time = {"gap": 0.0, "sage": 0.0}
+        self._failed = set()
+        self._choice = None
+        self._reason = None
+
+    def estimate(self, implementation):
+        """
+        Return the estimated cost, in seconds, of a call to ``implementation`` (``"gap"`` or ``"sage"``).
+        """
+        if implementation in self._failed:
+            return float("inf")
+        if self._calls[implementation]:
+            return self._time[implementation] / self._calls[implementation]
+        hint = self._hints[implementation]
+        return float("inf") if hint is None else hint
+
+    def _decide(self):
+        estimates = [(self.estimate(implementation), implementation)
+                     for implementation in self.implementations]
+        choice = min(estimates)[1]
+        def describe(implementation):
+            if implementation in self._failed:
+                return "inf (failed)"
+            if self._calls[implementation]:
+                return "{:.2g}s (measured)".format(self.estimate(implementation))
+            return "{:.2g}s (hint)".format(self.estimate(implementation))
+        self._choice = choice
+        self._reason = "cost estimates: " + ", ".join(
+            "{}={}".format(implementation, describe(implementation))
+            for implementation in self.implementations)
+        return choice
+
+    def _run(self, implementation, args, kwds):
+        start = clock()
+        result = self._methods[implementation](*args, **kwds)
+        self._calls[implementation] += 1
+        self._time[implementation] += clock() - start
+        return result
+
+    def __call__(self, *args, **kwds):
+        choice = self._decide()
+        try:
+            return self._run(choice, args, kwds)
+        except self.failures:
+            # An implementation that worked before is not to blame
+            other = "sage" if choice == "gap" else "gap"
+            if self._calls[choice] or other in self._failed:
+                raise
+            self._failed.add(choice)
+        return self._run(self._decide(), args, kwds)
+
+    def decision(self):
+        """
+        Return a dictionary describing the last decision of this dispatcher.
+
+        The ``choice`` is ``None`` until the method gets called.
+        """
+        return {"choice": self._choice,
+                "reason": self._reason,
+                "calls": dict(self._calls)}
+
+    def __repr__(self):
+        return "<cost aware method {} of {}: {}>".format(self.__name__, self._parent_name, self._choice)
 
 ##############################################################################
 
@@ -907,7 +3216,7 @@ nested_classes_of_categories = [
 def mmt_lookup_signature(*args):
     raise NotImplementedError
 
-def generate_code(name, semantic):
+def generate_code(name, semantic, qualname=None):
     codomain = semantic.get("codomain")
     arity = semantic.get("arity")
     gap_name = semantic.get("gap")
@@ -931,9 +3240,16 @@ def generate_code(name, semantic):
     assert gap_name is not None
     if codomain is None:
         codomain = typing.Any
+    if qualname is None:
+        qualname = name
     #assert isinstance(codomain, DependentType)
+    deferrable = gap_name in deferred_operations and codomain is typing.ParentOfSelf
+    @routed
     def wrapper_method(self, *args):
-        return from_handle(typing.specialize(codomain, self))(getattr(libgap, gap_name)(*gap_handle((self,)+args)))
+        if deferrable and deferred_arithmetic.depth:
+            return gap_operation(self.parent(), gap_name, self, *args)
+        return call_gap_operation(qualname, gap_name, (self,)+args,
+                                  from_handle(typing.specialize(codomain, self)))
     wrapper_method.__name__ = name
     wrapper_method.__doc__ = textwrap.dedent("""
     Wrapper around GAP's method {}
@@ -971,9 +3287,16 @@ def generate_GAP_subcategory_class(cls):
             setattr(GAP_cls, name, target)
 
         for (key, semantic) in semantic.items():
-            setattr(target, key, generate_code(key, semantic))
+            qualname = "{}.GAP.{}.{}".format(cls.__name__, name, key)
+            wrapper = generate_code(key, semantic, qualname)
+            setattr(target, key, wrapper)
+            if qualname in gap_cost_hints:
+                register_cost_aware_method(key, wrapper, gap_cost_hints[qualname])
 
 # TODO: add a hook so that categories annotated later on get aligned
 for cls in typing.annotated_categories:
     fill_allignment_database(cls)
     generate_GAP_subcategory_class(cls)
+
+import categories.sets_cat
+register_cost_hinted_methods(categories.sets_cat)
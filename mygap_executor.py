@@ -0,0 +1,197 @@
+r"""
+A GAP executor thread for multithreaded applications
+
+libgap is not thread safe: GAP must not be entered concurrently from
+several threads. A :class:`GAPExecutor` owns a dedicated thread which
+runs, one at a time, the GAP calls submitted from any other thread
+through a queue.
+
+Once the executor is started, all the operations on semantic handles
+(construction, wrapper methods, iteration, equality, printing, ...)
+are transparently routed through it (see :func:`mygap.routed`).
+Calls made from within the executor thread itself are run directly.
+Each call runs within the scopes and the deferred arithmetic context
+of the calling thread (see :meth:`mygap.MyGap.scope` and
+:meth:`mygap.MyGap.deferred`).
+
+Calls to pure operations (see :data:`mygap.pure_operations`) that
+are pending at the same time -- that is the same function called on
+the same objects -- are coalesced: the call is run once, and all the
+callers get its result. Other calls, like iterating, evaluating GAP
+code or drawing random elements, are never coalesced.
+
+EXAMPLES::
+
+    sage: from mygap import mygap
+    sage: from mygap_executor import GAPExecutor
+    sage: executor = GAPExecutor().start()
+
+    sage: import threading
+    sage: results = []
+    sage: def work(n):
+    ....:     results.append((n, mygap.SymmetricGroup(n).cardinality()))
+    sage: threads = [threading.Thread(target=work, args=(n,)) for n in range(1, 7)]
+    sage: for thread in threads: thread.start()
+    sage: for thread in threads: thread.join()
+    sage: sorted(results)
+    [(1, 1), (2, 2), (3, 6), (4, 24), (5, 120), (6, 720)]
+
+    sage: executor.stop()
+
+.. WARNING::
+
+    Operations that bypass the semantic layer, like calling methods
+    of the libgap handles returned by ``.gap()``, are not routed;
+    wrap them with :func:`mygap.gap_call`.
+"""
+import threading
+from concurrent.futures import Future
+
+try:
+    import queue
+except ImportError: # Python 2
+    import Queue as queue
+
+import mygap
+
+class GAPExecutor(object):
+    """
+    An executor running GAP calls in a dedicated thread.
+
+    INPUT:
+
+    - ``coalesce`` -- a boolean (default: ``True``); whether to
+      coalesce identical pending calls submitted with ``coalesce=True``
+    """
+    def __init__(self, coalesce=True):
+        self._coalesce = coalesce
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the executor thread, route the GAP calls through it, and return ``self``.
+        """
+        if mygap.gap_executor is not None:
+            raise RuntimeError("a GAP executor is already running")
+        self._thread = threading.Thread(target=self._run, name="GAP executor")
+        self._thread.daemon = True
+        self._thread.start()
+        mygap.gap_executor = self
+        return self
+
+    def stop(self):
+        """
+        Stop routing the GAP calls, and stop the executor thread once the pending calls are done.
+
+        Stopping an executor that is not running does nothing.
+        """
+        if mygap.gap_executor is self:
+            mygap.gap_executor = None
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            key, f, args, kwds, future, scopes, deferred = task
+            # The call runs in the scopes and deferred arithmetic
+            # context of the caller
+            mygap.handle_scopes.stack = scopes
+            mygap.deferred_arithmetic.depth = deferred
+            try:
+                result = f(*args, **kwds)
+            except BaseException as exception:
+                self._done(key)
+                future.set_exception(exception)
+            else:
+                self._done(key)
+                future.set_result(result)
+
+    def _done(self, key):
+        if key is not None:
+            with self._lock:
+                del self._pending[key]
+
+    def submit(self, f, *args, coalesce=False, **kwds):
+        """
+        Submit the call ``f(*args, **kwds)`` and return a :class:`concurrent.futures.Future` for its result.
+
+        INPUT:
+
+        - ``coalesce`` -- a boolean (default: ``False``); whether
+          this call may share its result with an identical pending
+          call, that is the same function on the same objects. Only
+          set it for calls whose result depends on nothing else.
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: from mygap_executor import GAPExecutor
+            sage: with GAPExecutor() as executor:
+            ....:     future = executor.submit(mygap.eval, "Factorial(10)")
+            ....:     future.result()
+            3628800
+
+        Identical pending calls submitted with ``coalesce=True`` share
+        the same future; other calls are run each time::
+
+            sage: import threading
+            sage: with GAPExecutor() as executor:
+            ....:     event = threading.Event()
+            ....:     blocker = executor.submit(event.wait)
+            ....:     code = "Factorial(10)"
+            ....:     f1 = executor.submit(mygap.eval, code, coalesce=True)
+            ....:     f2 = executor.submit(mygap.eval, code, coalesce=True)
+            ....:     f3 = executor.submit(mygap.eval, code)
+            ....:     event.set()
+            sage: f1 is f2, f1 is f3
+            (True, False)
+
+        An executor can be stopped twice, or before being started::
+
+            sage: executor = GAPExecutor()
+            sage: executor.stop()
+            sage: executor.start().stop(); executor.stop()
+        """
+        key = None
+        if coalesce and self._coalesce:
+            # Identity based: the arguments are kept alive in the
+            # pending task, so their ids can't be reused meanwhile
+            key = (f, tuple(id(arg) for arg in args),
+                   tuple(sorted((name, id(value)) for name, value in kwds.items())))
+            with self._lock:
+                future = self._pending.get(key)
+                if future is not None:
+                    return future
+                future = Future()
+                self._pending[key] = future
+        else:
+            future = Future()
+        self._queue.put((key, f, args, kwds, future,
+                         mygap.handle_scopes.stack, mygap.deferred_arithmetic.depth))
+        return future
+
+    def call(self, f, *args, coalesce=False, **kwds):
+        """
+        Return ``f(*args, **kwds)``, run in the executor thread.
+
+        When called from the executor thread, ``f`` is run directly.
+        See :meth:`submit` for ``coalesce``.
+        """
+        if threading.current_thread() is self._thread:
+            return f(*args, **kwds)
+        return self.submit(f, *args, coalesce=coalesce, **kwds).result()
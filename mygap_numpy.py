@@ -0,0 +1,311 @@
+r"""
+Bulk conversions between NumPy arrays and GAP objects
+
+Converting many permutations, transformations or matrices element by
+element through ``libgap`` costs one conversion, and one semantic
+handle, per element. The functions of this module build them all at
+once: the array is shipped to GAP as a single list, and the GAP
+objects are constructed there by a single call to a compiled GAP
+function (see :func:`mygap.compiled_function`). The result is a
+:class:`mygap.GAPList`, whose items are wrapped on access only.
+Conversely, :func:`to_numpy` exports the images of a collection of
+permutations or transformations with a single GAP call.
+
+Arrays are 0-based: a permutation or transformation of degree `n` is
+given by the row of its images of `0, \dots, n-1`.
+
+EXAMPLES::
+
+    sage: import numpy
+    sage: from mygap import mygap
+    sage: T = mygap.transformations_from_array(numpy.array([[1, 1, 2], [0, 0, 0]])); T
+    [ Transformation( [ 2, 2, 3 ] ), Transformation( [ 1, 1, 1 ] ) ]
+    sage: S = mygap.Semigroup(T); S.cardinality()
+    3
+
+    sage: P = mygap.permutations_from_array(numpy.array([[1, 0, 2], [1, 2, 0]]))
+    sage: mygap.Group(P).cardinality()
+    6
+
+    sage: a = numpy.array([[[1, 2], [0, 1]], [[1, 0], [1, 1]]])
+    sage: mygap.matrices_from_array(a, GF(3))
+    [ [ [ Z(3)^0, Z(3) ], [ 0*Z(3), Z(3)^0 ] ], [ [ Z(3)^0, 0*Z(3) ], [ Z(3)^0, Z(3)^0 ] ] ]
+
+    sage: T.to_numpy()
+    array([[1, 1, 2],
+           [0, 0, 0]], dtype=uint8)
+"""
+import numpy
+
+from sage.libs.gap.libgap import libgap
+
+import mygap
+
+_permutations = "data -> List(data, PermList)"
+_transformations = "data -> List(data, Transformation)"
+_matrices_integer = "function(data, F) return List(data, m -> ImmutableMatrix(F, m * One(F))); end"
+_matrices_log = """function(data, F)
+    local elements;
+    elements := Concatenation([Zero(F)], List([0 .. Size(F) - 2], k -> PrimitiveRoot(F)^k));
+    return List(data, m -> ImmutableMatrix(F, List(m, row -> elements{row})));
+end"""
+_images = """function(elements, n)
+    local m;
+    if not IsList(elements) then
+        elements := List(elements);
+    fi;
+    if IsEmpty(elements) then
+        return [n, n, ""];
+    elif IsPermCollection(elements) then
+        m := Maximum(LargestMovedPoint(elements), 1);
+        if n = 0 then
+            n := m;
+        elif n < m then
+            return [n, m, ""];
+        fi;
+        elements := List(elements, p -> ListPerm(p, n));
+    elif IsTransformationCollection(elements) then
+        m := Maximum(DegreeOfTransformationCollection(elements), 1);
+        if n = 0 then
+            n := m;
+        elif n < m then
+            return [n, m, ""];
+        fi;
+        elements := List(elements, t -> ImageListOfTransformation(t, n));
+    else
+        Error("expected a collection of permutations or transformations");
+    fi;
+    return [n, m, JoinStringsWithSeparator(List(Concatenation(elements), String), ",")];
+end"""
+
+def _integer_array(array, ndim):
+    """
+    Return ``array`` as a NumPy integer array of dimension ``ndim``, or raise a :class:`ValueError`.
+    """
+    array = numpy.asarray(array)
+    if array.ndim != ndim:
+        raise ValueError("expected a {}-dimensional array, got {} dimension(s)".format(ndim, array.ndim))
+    if not numpy.issubdtype(array.dtype, numpy.integer):
+        raise ValueError("expected an integer array, got dtype {}".format(array.dtype))
+    return array
+
+def _to_gap(array):
+    """
+    Return a libgap handle on the nested GAP list with the entries of ``array``.
+
+    The list is parsed by GAP from its printed form, which is much
+    faster than converting the entries one by one.
+    """
+    return libgap.eval(str(array.tolist()))
+
+def integers_from_string(string, dtype=numpy.int64):
+    """
+    Return the NumPy array of the comma separated integers of the GAP string ``string``.
+
+    This is how the compiled GAP functions of this module, and of the
+    categories, transport long lists of integers back: GAP joins them
+    in a single string, which NumPy parses at once.
+
+    With ``dtype=object``, the entries are parsed as Python integers
+    instead; use this when they may not fit in 64 bits.
+
+    EXAMPLES::
+
+        sage: from mygap_numpy import integers_from_string
+        sage: integers_from_string(libgap("3,1,-4"))
+        array([ 3,  1, -4])
+        sage: integers_from_string(libgap("")).shape
+        (0,)
+        sage: integers_from_string(libgap("2,100000000000000000000"), dtype=object)
+        array([2, 100000000000000000000], dtype=object)
+    """
+    string = string.sage()
+    if not string:
+        return numpy.zeros(0, dtype=dtype)
+    if dtype is object:
+        return numpy.array([int(x) for x in string.split(",")], dtype=object)
+    return numpy.fromstring(string, dtype=dtype, sep=",")
+
+def permutations_from_array(array):
+    r"""
+    Return the list of the permutations given by the rows of ``array``.
+
+    INPUT:
+
+    - ``array`` -- a 2-dimensional NumPy integer array of shape
+      ``(k, n)`` whose rows are permutations of `0, \dots, n-1`
+
+    OUTPUT: a :class:`mygap.GAPList` of GAP permutations
+
+    EXAMPLES::
+
+        sage: import numpy
+        sage: from mygap_numpy import permutations_from_array
+        sage: P = permutations_from_array(numpy.array([[1, 0, 2, 3], [0, 1, 3, 2]])); P
+        [ (1,2), (3,4) ]
+        sage: P[0]
+        (1,2)
+        sage: permutations_from_array(numpy.array([[0, 0]]))
+        Traceback (most recent call last):
+        ...
+        ValueError: the rows of the array are not all permutations of 0..1
+    """
+    array = _integer_array(array, 2)
+    n = array.shape[1]
+    if not (numpy.sort(array, axis=1) == numpy.arange(n)).all():
+        raise ValueError("the rows of the array are not all permutations of 0..{}".format(n - 1))
+    return mygap.GAPList(mygap.gap_call(mygap.compiled_function(_permutations), _to_gap(array + 1)))
+
+def transformations_from_array(array):
+    r"""
+    Return the list of the transformations given by the rows of ``array``.
+
+    INPUT:
+
+    - ``array`` -- a 2-dimensional NumPy integer array of shape
+      ``(k, n)`` with entries in `0, \dots, n-1`
+
+    OUTPUT: a :class:`mygap.GAPList` of GAP transformations
+
+    EXAMPLES::
+
+        sage: import numpy
+        sage: from mygap_numpy import transformations_from_array
+        sage: a = numpy.random.randint(0, 5, size=(10^4, 5))
+        sage: T = transformations_from_array(a); T
+        <GAP list of 10000 items>
+        sage: T[3].gap().ImageListOfTransformation(5).sage() == list(a[3] + 1)
+        True
+        sage: transformations_from_array(numpy.array([[0, 2]]))
+        Traceback (most recent call last):
+        ...
+        ValueError: the entries of the array are not all in 0..1
+    """
+    array = _integer_array(array, 2)
+    n = array.shape[1]
+    if array.size and (array.min() < 0 or array.max() >= n):
+        raise ValueError("the entries of the array are not all in 0..{}".format(n - 1))
+    return mygap.GAPList(mygap.gap_call(mygap.compiled_function(_transformations), _to_gap(array + 1)))
+
+def matrices_from_array(array, field, encoding="integer"):
+    r"""
+    Return the list of the matrices over ``field`` given by ``array``.
+
+    INPUT:
+
+    - ``array`` -- a 3-dimensional NumPy integer array of shape
+      ``(k, r, c)``
+    - ``field`` -- a finite field (a Sage field, or a GAP field as
+      libgap or semantic handle)
+    - ``encoding`` -- ``"integer"`` (default) or ``"log"``; how
+      the entries encode the field elements:
+
+      - ``"integer"``: the entry `a` stands for `a \cdot 1`; this
+        only makes sense over prime fields
+      - ``"log"``: the entry `0` stands for `0`, and the entry `k+1`
+        for `z^k`, where `z` is the primitive root of ``field`` in GAP
+
+    OUTPUT: a :class:`mygap.GAPList` of immutable GAP matrices
+
+    EXAMPLES::
+
+        sage: import numpy
+        sage: from mygap_numpy import matrices_from_array
+        sage: M = matrices_from_array(numpy.array([[[0, 1], [2, 3]]]), GF(4), encoding="log")
+        sage: M[0]
+        [ [ 0*Z(2), Z(2)^0 ], [ Z(2^2), Z(2^2)^2 ] ]
+        sage: matrices_from_array(numpy.array([[[0, 1], [2, 4]]]), GF(4), encoding="log")
+        Traceback (most recent call last):
+        ...
+        ValueError: the entries of the array are not all in 0..3
+        sage: matrices_from_array(numpy.array([[[0, 1]]]), GF(4))
+        Traceback (most recent call last):
+        ...
+        ValueError: the integer encoding requires a prime field; use encoding="log"
+    """
+    array = _integer_array(array, 3)
+    F = mygap.gap_handle(field)
+    q = F.Size().sage()
+    if encoding == "integer":
+        if not F.IsPrimeField().sage():
+            raise ValueError('the integer encoding requires a prime field; use encoding="log"')
+        code = _matrices_integer
+    elif encoding == "log":
+        if array.size and (array.min() < 0 or array.max() >= q):
+            raise ValueError("the entries of the array are not all in 0..{}".format(q - 1))
+        code = _matrices_log
+        array = array + 1
+    else:
+        raise ValueError("unknown encoding: {}".format(encoding))
+    return mygap.GAPList(mygap.gap_call(mygap.compiled_function(code), _to_gap(array), F))
+
+def image_dtype(degree):
+    r"""
+    Return the smallest unsigned NumPy integer type holding the points `0, \dots, degree-1`.
+
+    EXAMPLES::
+
+        sage: from mygap_numpy import image_dtype
+        sage: image_dtype(8), image_dtype(256), image_dtype(257), image_dtype(10^5)
+        (dtype('uint8'), dtype('uint8'), dtype('uint16'), dtype('uint32'))
+    """
+    for dtype in (numpy.uint8, numpy.uint16, numpy.uint32):
+        if degree - 1 <= numpy.iinfo(dtype).max:
+            return numpy.dtype(dtype)
+    return numpy.dtype(numpy.uint64)
+
+def to_numpy(elements, degree=None):
+    r"""
+    Return the array of the images of the permutations or transformations ``elements``.
+
+    INPUT:
+
+    - ``elements`` -- a GAP collection of permutations or
+      transformations (as libgap or semantic handle), or a list of
+      permutations or transformations
+    - ``degree`` -- a positive integer or ``None`` (default); the
+      number `n` of points on which to take the images; by default
+      the largest moved point, or the degree of the transformations;
+      a smaller ``degree`` raises a :class:`ValueError`
+
+    OUTPUT:
+
+    A contiguous NumPy array of shape ``(k, n)`` whose rows are the
+    0-based images of `0, \dots, n-1` under the ``k`` elements; its
+    dtype is the smallest unsigned integer type that fits (see
+    :func:`image_dtype`).
+
+    The images are computed and transported by a single GAP call.
+
+    EXAMPLES::
+
+        sage: from mygap import mygap
+        sage: from mygap_numpy import to_numpy
+        sage: G = mygap.SymmetricGroup(3)
+        sage: to_numpy(G)
+        array([[0, 1, 2],
+               [0, 2, 1],
+               [1, 0, 2],
+               [1, 2, 0],
+               [2, 0, 1],
+               [2, 1, 0]], dtype=uint8)
+        sage: to_numpy([G.an_element()], degree=5)
+        array([[1, 2, 0, 3, 4]], dtype=uint8)
+        sage: to_numpy([])
+        array([], shape=(0, 0), dtype=uint8)
+        sage: to_numpy(G, degree=2)
+        Traceback (most recent call last):
+        ...
+        ValueError: the degree 2 is smaller than the degree 3 of the elements
+    """
+    if isinstance(elements, (list, tuple)):
+        elements = mygap.gap_list(elements)
+    else:
+        elements = mygap.gap_handle(elements)
+    n, m, images = mygap.gap_call(mygap.compiled_function(_images), elements, degree or 0)
+    n = n.sage()
+    if n < m.sage():
+        raise ValueError("the degree {} is smaller than the degree {} of the elements".format(n, m))
+    images = integers_from_string(images) - 1
+    return numpy.ascontiguousarray(images.reshape(-1, n) if n else images.reshape(0, 0),
+                                   dtype=image_dtype(n))
@@ -0,0 +1,403 @@
+r"""
+Streaming binary OpenMath export and import of semantic handles
+
+Exchanging large collections of GAP objects with other systems through
+their printed forms requires building giant strings in memory. An
+:class:`OpenMathWriter` instead writes semantic handles, and
+collections of them, to a binary file or socket (any object with a
+``write`` method) as binary encoded OpenMath objects, token by token;
+the items of a collection are converted and written one at a time.
+Conversely, an :class:`OpenMathReader` parses the objects from a file
+(any object with a ``read`` method), and rebuilds the semantic handles
+on the fly; :meth:`OpenMathReader.iter_list` yields the items of a
+list one at a time.
+
+The following objects are supported, with the OpenMath symbols used
+by GAP's SCSCP implementation:
+
+- integers, as ``OMI``
+- floats, strings and byte strings, as ``OMF``, ``OMSTR`` and ``OMB``
+- booleans, as ``logic1.true`` and ``logic1.false``
+- lists, as applications of ``list1.list``
+- permutations, as applications of ``permut1.permutation`` to their
+  list of images
+- any other GAP object, as an application of
+  ``scscp_transient_1.DeserializeNativeString`` to the byte string
+  returned by :func:`mygap.gap_serialize`; such objects can only be
+  read back by GAP of the same version and architecture
+
+EXAMPLES::
+
+    sage: from mygap import mygap
+    sage: from mygap_openmath import dumps, loads
+    sage: dumps(3)
+    b'\x18\x01\x03\x19'
+    sage: dumps([1, -300, 2^40])
+    b'\x18\x10\x08\x05\x04list1list\x01\x01\x81\xff\xff\xfe\xd4\x02\r+\x001099511627776\x11\x19'
+    sage: loads(dumps([1, -300, 2^40]))
+    [1, -300, 1099511627776]
+
+    sage: G = mygap.SymmetricGroup(4)
+    sage: L = loads(dumps(G.list()), parent=G)
+    sage: L == G.list(), L[0].parent() is G
+    (True, True)
+    sage: loads(dumps(mygap.FreeGroup(2)))
+    <free group on the generators [ f1, f2 ]>
+
+Large collections are streamed to and from files::
+
+    sage: import os, tempfile
+    sage: path = os.path.join(tempfile.mkdtemp(), "elements.om")
+    sage: from mygap_openmath import OpenMathWriter, OpenMathReader
+    sage: G = mygap.SymmetricGroup(7)
+    sage: with open(path, "wb") as f:
+    ....:     OpenMathWriter(f).write_list(G.list())
+    sage: with open(path, "rb") as f:
+    ....:     n = sum(1 for x in OpenMathReader(f, parent=G).iter_list() if x.gap().Order() == 2)
+    sage: n
+    231
+"""
+import io
+import struct
+
+from sage.libs.gap.libgap import libgap
+from sage.libs.gap.element import GapElement
+from sage.rings.integer import Integer
+
+import mygap
+
+# Tokens of the binary encoding; with the long flag, the lengths are
+# encoded on 4 bytes instead of 1
+OMI = 0x01
+OMI_BIG = 0x02
+OMF = 0x03
+OMB = 0x04
+OMV = 0x05
+OMSTR = 0x06
+OMSTR_UTF16 = 0x07
+OMS = 0x08
+OMA_BEGIN = 0x10
+OMA_END = 0x11
+OMATTR_BEGIN = 0x12
+OMATTR_END = 0x13
+OMATP_BEGIN = 0x14
+OMATP_END = 0x15
+OMOBJ_BEGIN = 0x18
+OMOBJ_END = 0x19
+LONG = 0x80
+
+LIST = ("list1", "list")
+PERMUTATION = ("permut1", "permutation")
+NATIVE = ("scscp_transient_1", "DeserializeNativeString")
+TRUE = ("logic1", "true")
+FALSE = ("logic1", "false")
+
+# The kind and data of a GAP object, as written by the writer; 0
+# stands for a serialized GAP object
+_gap_data = """function(x)
+    if IsInt(x) then
+        return [1, x];
+    elif IsPerm(x) then
+        return [2, ListPerm(x)];
+    elif IsStringRep(x) then
+        return [3, x];
+    elif IsBool(x) and x <> fail then
+        return [4, x];
+    elif IsDenseList(x) then
+        return [5, Length(x)];
+    fi;
+    return [0, 0];
+end"""
+
+class OpenMathWriter(object):
+    """
+    A writer of binary OpenMath objects to the binary file ``file``.
+
+    INPUT:
+
+    - ``file`` -- an object with a ``write`` method accepting bytes,
+      e.g. a file opened in binary mode, or ``socket.makefile("wb")``
+
+    The tokens are written as they are produced; wrap ``file`` in an
+    :class:`io.BufferedWriter` if it is unbuffered.
+
+    See the module documentation for examples.
+    """
+    def __init__(self, file):
+        self._file = file
+
+    def write(self, obj):
+        """
+        Write ``obj`` as an OpenMath object.
+        """
+        self._token(OMOBJ_BEGIN)
+        self._write(obj)
+        self._token(OMOBJ_END)
+
+    def write_list(self, items):
+        """
+        Write the iterable ``items`` as an OpenMath list, converting and writing the items one at a time.
+        """
+        self._token(OMOBJ_BEGIN)
+        self._write_list(items)
+        self._token(OMOBJ_END)
+
+    def _token(self, token):
+        self._file.write(bytes([token]))
+
+    def _sized(self, token, payload):
+        n = len(payload)
+        if n < 256:
+            self._file.write(bytes([token, n]) + payload)
+        else:
+            self._file.write(bytes([token | LONG]) + struct.pack(">I", n) + payload)
+
+    def _write_symbol(self, symbol):
+        cd, name = [part.encode("ascii") for part in symbol]
+        if len(cd) < 256 and len(name) < 256:
+            self._file.write(bytes([OMS, len(cd), len(name)]) + cd + name)
+        else:
+            self._file.write(bytes([OMS | LONG]) + struct.pack(">II", len(cd), len(name)) + cd + name)
+
+    def _write_integer(self, n):
+        if -2**7 <= n < 2**7:
+            self._file.write(bytes([OMI]) + struct.pack(">b", n))
+        elif -2**31 <= n < 2**31:
+            self._file.write(bytes([OMI | LONG]) + struct.pack(">i", n))
+        else:
+            digits = str(abs(n)).encode("ascii")
+            header = b"-\x00" if n < 0 else b"+\x00"
+            n = len(digits)
+            if n < 256:
+                self._file.write(bytes([OMI_BIG, n]) + header + digits)
+            else:
+                self._file.write(bytes([OMI_BIG | LONG]) + struct.pack(">I", n) + header + digits)
+
+    def _write_string(self, s):
+        try:
+            self._sized(OMSTR, s.encode("latin-1"))
+        except UnicodeEncodeError:
+            self._sized(OMSTR_UTF16, s.encode("utf-16-be"))
+
+    def _write_application(self, symbol, arguments):
+        self._token(OMA_BEGIN)
+        self._write_symbol(symbol)
+        for argument in arguments:
+            self._write(argument)
+        self._token(OMA_END)
+
+    def _write_list(self, items):
+        self._write_application(LIST, items)
+
+    def _write(self, obj):
+        if isinstance(obj, mygap.GAPObject):
+            obj = obj.gap()
+        if isinstance(obj, GapElement):
+            self._write_gap(obj)
+        elif isinstance(obj, bool):
+            self._write_symbol(TRUE if obj else FALSE)
+        elif isinstance(obj, (int, Integer)):
+            self._write_integer(int(obj))
+        elif isinstance(obj, float):
+            self._file.write(bytes([OMF]) + struct.pack(">d", obj))
+        elif isinstance(obj, str):
+            self._write_string(obj)
+        elif isinstance(obj, (bytes, bytearray)):
+            self._sized(OMB, bytes(obj))
+        elif isinstance(obj, (list, tuple)):
+            self._write_list(obj)
+        else:
+            raise TypeError("cannot write {!r} as OpenMath".format(obj))
+
+    def _write_gap(self, handle):
+        kind, data = mygap.gap_call(mygap.compiled_function(_gap_data), handle)
+        kind = kind.sage()
+        if kind == 1:
+            self._write_integer(int(data.sage()))
+        elif kind == 2:
+            self._write_application(PERMUTATION, data.sage())
+        elif kind == 3:
+            self._write_string(data.sage())
+        elif kind == 4:
+            self._write_symbol(TRUE if data.sage() else FALSE)
+        elif kind == 5:
+            self._write_list(handle[i] for i in range(data.sage()))
+        else:
+            self._write_application(NATIVE, [mygap.gap_serialize(handle)])
+
+class OpenMathReader(object):
+    """
+    A reader of binary OpenMath objects from the binary file ``file``.
+
+    INPUT:
+
+    - ``file`` -- an object with a ``read`` method returning bytes,
+      e.g. a file opened in binary mode, or ``socket.makefile("rb")``
+    - ``parent`` -- a semantic handle or ``None`` (default); if
+      specified, the GAP objects read (permutations, deserialized
+      objects) are wrapped as elements of ``parent``, and otherwise
+      by :func:`mygap.GAP`
+
+    Integers are read as Sage integers, and lists as Python lists.
+    Attributions are skipped: the attributed object is returned.
+
+    See the module documentation for examples.
+    """
+    def __init__(self, file, parent=None):
+        self._file = file
+        self._parent = parent
+
+    def read(self):
+        """
+        Read an OpenMath object.
+
+        An :class:`EOFError` is raised at the end of the file.
+        """
+        self._expect(OMOBJ_BEGIN)
+        result = self._object(self._byte())
+        self._expect(OMOBJ_END)
+        return result
+
+    def __iter__(self):
+        """
+        Iterate over the OpenMath objects until the end of the file.
+        """
+        while True:
+            token = self._file.read(1)
+            if not token:
+                return
+            if token[0] != OMOBJ_BEGIN:
+                raise ValueError("expected the beginning of an OpenMath object, got token {:#x}".format(token[0]))
+            result = self._object(self._byte())
+            self._expect(OMOBJ_END)
+            yield result
+
+    def iter_list(self):
+        """
+        Iterate over the items of an OpenMath object which is a list, reading them one at a time.
+        """
+        self._expect(OMOBJ_BEGIN)
+        self._expect(OMA_BEGIN)
+        symbol = self._symbol(self._byte())
+        if symbol != LIST:
+            raise ValueError("expected a list, got an application of {}.{}".format(*symbol))
+        while True:
+            token = self._byte()
+            if token == OMA_END:
+                break
+            yield self._object(token)
+        self._expect(OMOBJ_END)
+
+    def _bytes(self, n):
+        chunks = []
+        while n:
+            chunk = self._file.read(n)
+            if not chunk:
+                raise EOFError("unexpected end of the OpenMath stream")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b"".join(chunks)
+
+    def _byte(self):
+        return self._bytes(1)[0]
+
+    def _expect(self, expected):
+        token = self._byte()
+        if token != expected:
+            raise ValueError("expected token {:#x}, got {:#x}".format(expected, token))
+
+    def _length(self, token):
+        if token & LONG:
+            return struct.unpack(">I", self._bytes(4))[0]
+        return self._byte()
+
+    def _symbol(self, token):
+        if token & ~LONG != OMS:
+            raise ValueError("expected a symbol, got token {:#x}".format(token))
+        if token & LONG:
+            n, m = struct.unpack(">II", self._bytes(8))
+        else:
+            n, m = self._bytes(2)
+        return (self._bytes(n).decode("ascii"), self._bytes(m).decode("ascii"))
+
+    def _wrap(self, handle):
+        if self._parent is None:
+            return mygap.GAP(handle)
+        return self._parent(handle)
+
+    def _arguments(self):
+        arguments = []
+        while True:
+            token = self._byte()
+            if token == OMA_END:
+                return arguments
+            arguments.append(self._object(token))
+
+    def _object(self, token):
+        kind = token & ~LONG
+        if kind == OMI:
+            if token & LONG:
+                return Integer(struct.unpack(">i", self._bytes(4))[0])
+            return Integer(struct.unpack(">b", self._bytes(1))[0])
+        if kind == OMI_BIG:
+            n = self._length(token)
+            sign, base = self._bytes(2)
+            result = Integer(self._bytes(n).decode("ascii"), 16 if base == 0x40 else 10)
+            return -result if sign == ord("-") else result
+        if kind == OMF:
+            return struct.unpack(">d", self._bytes(8))[0]
+        if kind == OMB:
+            return self._bytes(self._length(token))
+        if kind == OMSTR:
+            return self._bytes(self._length(token)).decode("latin-1")
+        if kind == OMSTR_UTF16:
+            return self._bytes(self._length(token)).decode("utf-16-be")
+        if kind == OMS:
+            symbol = self._symbol(token)
+            if symbol == TRUE:
+                return True
+            if symbol == FALSE:
+                return False
+            raise ValueError("unsupported symbol {}.{}".format(*symbol))
+        if token == OMATTR_BEGIN:
+            # The attributions, e.g. SCSCP call identifiers, are skipped
+            self._expect(OMATP_BEGIN)
+            while True:
+                token = self._byte()
+                if token == OMATP_END:
+                    break
+                self._symbol(token)
+                self._object(self._byte())
+            result = self._object(self._byte())
+            self._expect(OMATTR_END)
+            return result
+        if token == OMA_BEGIN:
+            symbol = self._symbol(self._byte())
+            if symbol == LIST:
+                return self._arguments()
+            if symbol == PERMUTATION:
+                return self._wrap(libgap.PermList([int(i) for i in self._arguments()]))
+            if symbol == NATIVE:
+                data, = self._arguments()
+                return self._wrap(mygap.gap_deserialize(data))
+            raise ValueError("unsupported application of {}.{}".format(*symbol))
+        raise ValueError("unsupported token {:#x}".format(token))
+
+def dumps(obj):
+    """
+    Return the binary OpenMath encoding of ``obj``.
+
+    See the module documentation for examples.
+    """
+    file = io.BytesIO()
+    OpenMathWriter(file).write(obj)
+    return file.getvalue()
+
+def loads(data, parent=None):
+    """
+    Return the object encoded in the binary OpenMath byte string ``data``.
+
+    See :class:`OpenMathReader` for ``parent``, and the module
+    documentation for examples.
+    """
+    return OpenMathReader(io.BytesIO(data), parent).read()
@@ -0,0 +1,206 @@
+r"""
+Pools of GAP worker processes
+
+libgap runs a single GAP instance inside the Sage process; hence
+computations on semantic handles use a single core. A :class:`Pool`
+starts several worker processes, each with its own GAP instance, and
+distributes independent method calls on semantic handles among them.
+
+Objects are shipped to and from the workers as GAP serialized strings
+(see :func:`mygap.gap_serialize`). Results which are GAP objects are
+rebuilt as semantic handles in the calling process; other results
+(e.g. Sage integers or booleans) are transmitted as is.
+
+EXAMPLES::
+
+    sage: from mygap import mygap
+    sage: groups = [mygap.SymmetricGroup(n) for n in range(1, 6)]
+    sage: with mygap.pool(2) as pool:
+    ....:     pool.map("cardinality", groups)
+    [1, 2, 6, 24, 120]
+
+Results that are GAP objects come back as semantic handles::
+
+    sage: with mygap.pool(2) as pool:
+    ....:     centers = pool.map("Centre", groups)
+    sage: centers
+    [Group(()), Group([ (1,2) ]), Group(()), Group(()), Group(())]
+    sage: centers[1] in Groups().GAP()
+    True
+
+or, on demand, converted to Sage objects in the workers::
+
+    sage: with mygap.pool(2) as pool:
+    ....:     pool.map("Size", groups, convert=True)
+    [1, 2, 6, 24, 120]
+
+Packages to be loaded in the workers can be specified::
+
+    sage: T = [mygap.FullTransformationMonoid(n) for n in range(1, 4)]
+    sage: with mygap.pool(2, packages=["semigroups"]) as pool:      # optional - semigroups
+    ....:     pool.map("structure_description_maximal_subgroups", T, convert=True)
+    [['1'], ['1', 'C2'], ['1', 'C2', 'S3']]
+
+.. TODO::
+
+    - Ship elements together with their parent, so that they are
+      rebuilt as elements rather than plain semantic handles.
+"""
+import multiprocessing
+
+from sage.libs.gap.libgap import libgap
+from sage.libs.gap.element import GapElement
+
+##############################################################################
+# Transport of objects between processes
+
+def to_transport(x):
+    """
+    Return a picklable representation of ``x``.
+
+    GAP objects (semantic or plain handles) are serialized; anything
+    else is left as is, and should be picklable.
+
+    EXAMPLES::
+
+        sage: from mygap import mygap
+        sage: from mygap_pool import to_transport, from_transport
+        sage: t = to_transport(mygap.SymmetricGroup(3)); t[0]
+        'gap'
+        sage: from_transport(t)
+        Sym( [ 1 .. 3 ] )
+        sage: to_transport(3)
+        ('value', 3)
+        sage: from_transport(to_transport(3))
+        3
+    """
+    from mygap import GAPObject, gap_serialize
+    if isinstance(x, (GAPObject, GapElement)):
+        return ("gap", gap_serialize(x))
+    return ("value", x)
+
+def from_transport(t):
+    """
+    Rebuild an object from its representation by :func:`to_transport`.
+
+    GAP objects are rebuilt as semantic handles.
+    """
+    import mygap
+    kind, data = t
+    if kind == "gap":
+        return mygap.GAP(mygap.gap_deserialize(data))
+    return data
+
+def convert(x):
+    """
+    Return the Sage conversion of ``x`` if it is a GAP object, and ``x`` otherwise.
+    """
+    from mygap import GAPObject
+    if isinstance(x, GAPObject):
+        x = x.gap()
+    if isinstance(x, GapElement):
+        return x.sage()
+    return x
+
+##############################################################################
+# Worker side
+
+def _initialize_worker(packages):
+    import mygap
+    for package in packages:
+        libgap.LoadPackage(package)
+
+def _call_method(arguments):
+    """
+    Run in a worker the method call described by ``arguments``.
+
+    Semantic handles are rebuilt from scratch in the worker; hence
+    ``method_name`` can be either a method of the semantic handle
+    (e.g. ``cardinality``) or, failing that, a GAP function (e.g. ``Size``)
+    that is called with the object as first argument.
+    """
+    import mygap
+    method_name, obj, args, convert_result = arguments
+    obj = from_transport(obj)
+    args = [from_transport(arg) for arg in args]
+    try:
+        method = getattr(obj, method_name)
+    except AttributeError:
+        result = getattr(mygap.mygap, method_name)(obj, *args)
+    else:
+        result = method(*args)
+    if convert_result:
+        result = convert(result)
+    return to_transport(result)
+
+##############################################################################
+
+class Pool(object):
+    """
+    A pool of GAP worker processes.
+
+    INPUT:
+
+    - ``processes`` -- the number of worker processes (default: the
+      number of cores)
+    - ``packages`` -- a list of GAP packages to load in each worker
+
+    The workers are forked from the current process; they therefore
+    start with a copy of its GAP workspace. See the module
+    documentation for examples.
+    """
+    def __init__(self, processes=None, packages=()):
+        self._pool = multiprocessing.Pool(processes,
+                                          initializer=_initialize_worker,
+                                          initargs=(tuple(packages),))
+
+    def map(self, method_name, objects, *args, **options):
+        r"""
+        Return the list of the results of ``obj.method_name(*args)`` for ``obj`` in ``objects``.
+
+        INPUT:
+
+        - ``method_name`` -- the name of a method of the semantic
+          handles, or of a GAP function
+        - ``objects`` -- an iterable of semantic handles
+        - ``args`` -- further arguments passed to each call
+        - ``convert`` -- a boolean (default: ``False``); whether to
+          convert the results which are GAP objects to Sage objects
+        - ``chunksize`` -- the number of objects sent at once to a
+          worker (default: 1)
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: M = mygap.FullTransformationMonoid(3)
+            sage: with mygap.pool(2) as pool:
+            ....:     pool.map("IsIdempotent", M.list(), convert=True).count(True)
+            10
+        """
+        convert_result = options.get("convert", False)
+        chunksize = options.get("chunksize", 1)
+        args = tuple(to_transport(arg) for arg in args)
+        tasks = [(method_name, to_transport(obj), args, convert_result)
+                 for obj in objects]
+        return [from_transport(result)
+                for result in self._pool.map(_call_method, tasks, chunksize)]
+
+    def close(self):
+        """
+        Shut down the worker processes once the pending tasks are done.
+        """
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """
+        Shut down immediately the worker processes.
+        """
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.terminate()
@@ -0,0 +1,241 @@
+r"""
+A persistent store for the results of pure GAP wrappers
+
+Batch jobs often recompute the same invariants -- cardinalities,
+Green's structure, structure descriptions -- of identical groups and
+semigroups across runs. A :class:`ResultStore` records the converted
+results of the methods listed in :data:`mygap.pure_operations` in a
+sqlite database, under a canonical key of the call; later calls, in
+this or another process, return the stored result without entering
+GAP.
+
+The key of a call is the SHA-256 digest of the name of the GAP
+operation and of canonical descriptions of its arguments, built by
+GAP from their construction:
+
+- the free generators and relators of finitely presented groups;
+- the generators of free groups;
+- the kind and the generators of groups, monoids and semigroups
+  generated by permutations, transformations, partial permutations,
+  or matrices over finite fields or cyclotomics;
+- the categories and printed form of atomic objects (integers,
+  permutations, transformations, ...).
+
+Calls involving other objects, for example subgroups of finitely
+presented groups, whose generators are words that only make sense
+relative to the ambient group, are not stored. The results are
+thus shared between equal groups given by the same generators; they
+are not shared between different generating sets of the same group.
+
+Results are pickled; results that can't be pickled are not stored.
+The store is bounded in number of entries and in bytes; the least
+recently used entries are evicted first.
+
+EXAMPLES::
+
+    sage: from mygap import mygap
+    sage: import os, tempfile
+    sage: path = os.path.join(tempfile.mkdtemp(), "results.sqlite")
+    sage: store = mygap.use_result_store(path)
+    sage: G = mygap.SymmetricGroup(6)
+    sage: G.cardinality()
+    720
+    sage: store.statistics()                    # random
+    {'entries': 1, 'hits': 0, 'misses': 1}
+
+A new handle on the same group, e.g. in a later job, hits the store::
+
+    sage: hits = store.statistics()['hits']
+    sage: mygap.SymmetricGroup(6).cardinality()
+    720
+    sage: store.statistics()['hits'] - hits
+    1
+    sage: mygap.use_result_store(None)
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+
+import mygap
+
+# The canonical description of a GAP object, or fail
+_canonical_description = """function(x)
+    local concrete;
+    # Generators whose printed form determines them, independently of
+    # any ambient object
+    concrete := gens -> not IsEmpty(gens) and ForAll(gens, g ->
+        IsPerm(g) or IsTransformation(g) or IsPartialPerm(g)
+        or (IsMatrix(g) and (IsFFECollColl(g) or IsCyclotomicCollColl(g))));
+    if IsFpGroup(x) and IsWholeFamily(x) then
+        return Concatenation("FpGroup", String(FreeGeneratorsOfFpGroup(x)),
+                             String(RelatorsOfFpGroup(x)));
+    elif IsFreeGroup(x) and IsWholeFamily(x) then
+        return Concatenation("FreeGroup", String(GeneratorsOfGroup(x)));
+    elif IsGroup(x) and HasGeneratorsOfGroup(x) and concrete(GeneratorsOfGroup(x)) then
+        return Concatenation("Group", String(GeneratorsOfGroup(x)));
+    elif IsMonoid(x) and HasGeneratorsOfMonoid(x) and concrete(GeneratorsOfMonoid(x)) then
+        return Concatenation("Monoid", String(GeneratorsOfMonoid(x)));
+    elif IsSemigroup(x) and HasGeneratorsOfSemigroup(x) and concrete(GeneratorsOfSemigroup(x)) then
+        return Concatenation("Semigroup", String(GeneratorsOfSemigroup(x)));
+    elif IsInt(x) or IsRat(x) or IsBool(x) or IsString(x) or IsPerm(x)
+         or IsTransformation(x) or IsFFE(x) then
+        return Concatenation(String(CategoriesOfObject(x)), String(x));
+    fi;
+    return fail;
+end"""
+
+class ResultStore(object):
+    """
+    A sqlite-backed store of the results of pure GAP wrappers.
+
+    INPUT:
+
+    - ``path`` -- the path of the sqlite database; it is created if
+      needed, and may be shared by several processes; ``":memory:"``
+      for a store lasting as long as this object
+    - ``max_entries`` -- the maximal number of stored results
+      (default: 100000)
+    - ``max_bytes`` -- the maximal total size of the pickled results
+      (default: 256 MiB)
+
+    See the module documentation for examples.
+    """
+    # Returned by :meth:`lookup` when there is no stored result
+    missing = object()
+
+    def __init__(self, path, max_entries=100000, max_bytes=2**28):
+        self.path = path if path == ":memory:" else os.path.abspath(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS results (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            accessed REAL NOT NULL)""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self._hits = 0
+        self._misses = 0
+
+    def __repr__(self):
+        return "Result store at {}".format(self.path)
+
+    def key(self, name, handles):
+        """
+        Return the canonical key of the call of the GAP operation ``name`` on ``handles``.
+
+        INPUT:
+
+        - ``name`` -- the name of a GAP operation
+        - ``handles`` -- a list of libgap handles
+
+        OUTPUT: a hexadecimal string, or ``None`` if some argument has
+        no canonical description
+
+        EXAMPLES::
+
+            sage: from mygap import mygap
+            sage: from result_store import ResultStore
+            sage: store = ResultStore(":memory:")
+            sage: G = libgap.eval("Group((1,2), (1,2,3))")
+            sage: store.key("Size", [G]) == store.key("Size", [libgap.eval("Group((1,2), (1,2,3))")])
+            True
+            sage: store.key("Size", [G]) == store.key("IsAbelian", [G])
+            False
+            sage: store.key("Size", [libgap.eval("Integers")]) is None
+            True
+
+        Subgroups of free or finitely presented groups are generated
+        by words, which depend on the ambient group; they get no key::
+
+            sage: F = libgap.FreeGroup("a", "b")
+            sage: a, b = F.GeneratorsOfGroup()
+            sage: store.key("Size", [F]) is None
+            False
+            sage: store.key("Size", [F.Subgroup([a, b])]) is None
+            True
+            sage: G = F / libgap([a**2])
+            sage: store.key("Size", [G]) == store.key("Size", [F])
+            False
+            sage: store.key("Size", [G.Subgroup(G.GeneratorsOfGroup())]) is None
+            True
+        """
+        describe = mygap.compiled_function(_canonical_description)
+        parts = [name]
+        for handle in handles:
+            description = mygap.gap_call(describe, handle)
+            if description == mygap.gap_fail:
+                return None
+            parts.append(description.sage())
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def lookup(self, key):
+        """
+        Return the result stored under ``key``, or :attr:`missing`.
+        """
+        row = self._connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._misses += 1
+            return self.missing
+        self._hits += 1
+        self._connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(row[0])
+
+    def record(self, key, value):
+        """
+        Store ``value`` under ``key``, and evict the least recently used results if needed.
+
+        Values that can't be pickled, or exceed :attr:`max_bytes` on
+        their own, are not stored.
+        """
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        if len(data) > self.max_bytes:
+            return
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                     (key, sqlite3.Binary(data), len(data), time.time()))
+            self._evict()
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def _evict(self):
+        entries, size = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        cursor = self._connection.execute("SELECT key, size FROM results ORDER BY accessed")
+        evicted = []
+        for key, entry_size in cursor:
+            if entries <= self.max_entries and size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            entries -= 1
+            size -= entry_size
+        cursor.close()
+        self._connection.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def statistics(self):
+        """
+        Return the number of stored results, and of hits and misses of this store object.
+        """
+        return {'entries': len(self), 'hits': self._hits, 'misses': self._misses}
+
+    def clear(self):
+        """
+        Remove all the stored results.
+        """
+        self._connection.execute("DELETE FROM results")
+
+    def close(self):
+        """
+        Close the database.
+        """
+        self._connection.close()
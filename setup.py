@@ -19,7 +19,7 @@ with open(os.path.join(here, 'README.md'), encoding='utf-8') as f:
 
 class SageTest(TestCommand):
     def run_tests(self):
-        errno = os.system("/opt/sage-git2/sage -t --force-lib mygap.py mmt.py categories/")
+        errno = os.system("/opt/sage-git2/sage -t --force-lib mygap.py mygap_pool.py amygap.py mygap_executor.py mygap_numpy.py froidure_pin.py native_elements.py result_store.py mygap_openmath.py mmt.py categories/")
         sys.exit(errno)
 
 setup(
@@ -41,8 +41,9 @@ setup(
         #'Programming Language :: Python :: 3',
     ],
     keywords='SageMath, GAP',
-    py_modules=['mygap','categories.objects'],
+    py_modules=['mygap','mygap_pool','amygap','mygap_executor','mygap_numpy','froidure_pin','native_elements','result_store','mygap_openmath','categories.objects'],
     install_requires=['recursive-monkey-patch',
+                      'numpy',
                       'sage-semantic-annotations @ git+https://github.com/nthiery/sage-semantic-annotations.git#egg=dev'], # 'Sage'
     cmdclass = {'test': SageTest},
 )